@@ -6,10 +6,14 @@ from django.utils.translation import ugettext_lazy as _
 
 from django_tables2.utils import A  # alias for Accessor
 
+from crm.models import SalesPerson
+
 __author__ = 'AMA'
 
 
 class UserListTable(tables.Table):
+    # One letter role code -> human readable text. Used at render time for the rows of the shown page only
+    ROLE_LABELS = dict(SalesPerson.ROLE_CHOICES)
 
     sp = tables.Column(_('роль'))
     user = tables.Column(_('сотрудник'))
@@ -20,4 +24,7 @@ class UserListTable(tables.Table):
         exclude = ('password','first_name','last_name')
         attrs = {'class': 'paleblue table table-striped table-bordered'}  # add class="paleblue" to <table> tag
         empty_text = _(
-            'Пока нет ни одного пользователя по продажам. Для добавления используйте соответствующий пункт меню')
\ No newline at end of file
+            'Пока нет ни одного пользователя по продажам. Для добавления используйте соответствующий пункт меню')
+
+    def render_sp(self, value):
+        return self.ROLE_LABELS.get(value, value)
\ No newline at end of file
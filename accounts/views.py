@@ -22,9 +22,8 @@ from registration import signals
 from accounts.forms import MyRegistrationFormUniqueEmail, MyAuthenticationForm
 from accounts.tables import UserListTable
 from crm.mixin import SomeUtilsMixin, add_lang
-from crm.models import SalesPerson
+from crm.user_context import get_user_context
 from guardian.decorators import permission_required
-from globalcustomer.models import Client
 from simpleCRM.settings import DEBUG
 
 
@@ -33,9 +32,8 @@ class MyTemplateView(TemplateView, SomeUtilsMixin):
 
     def get(self, request, *args, **kwargs):
         # Set language as is tenant language
-        rec = Client.objects.get(pk=request.tenant.pk)
         translation.deactivate_all()
-        translation.activate(rec.lang)
+        translation.activate(request.tenant_lang)
         # if the form updated we need to clear message query
         self.clearMsg(request)
         return super().get(self, request, *args, **kwargs)
@@ -82,9 +80,8 @@ class MyRegistrationView(RegistrationView, SomeUtilsMixin):
 
     def get(self, request, *args, **kwargs):
         # Set language as is tenant language
-        rec = Client.objects.get(pk=request.tenant.pk)
         translation.deactivate_all()
-        translation.activate(rec.lang)
+        translation.activate(request.tenant_lang)
         # if the form updated we need to clear message query
         self.clearMsg(request)
         return super().get(self, request, *args, **kwargs)
@@ -98,12 +95,6 @@ def tableUser(request):
     queryset = User.objects.annotate(sp=F('salesperson__role'))
     queryset = queryset.annotate(user=F('salesperson__first_name'))
 
-    for q in queryset:
-        # convert one symbol name to people friendly value
-        for choice in SalesPerson.ROLE_CHOICES:
-            if q.sp == choice[0]:
-                q.sp = choice[1]
-
     table = UserListTable(queryset)
     RequestConfig(request).configure(table)
     filter = 'NONFILTER'
@@ -120,10 +111,7 @@ class UserDeleteView(DeleteView):
     @method_decorator(login_required())
     @method_decorator(permission_required('auth.delete_user', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        try:
-            translation.activate(request.user.salesperson.lang)
-        except:
-            pass
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
 
@@ -133,10 +121,10 @@ class MyLogin(TemplateView, SomeUtilsMixin):
     def post(self, request, *args, **kwargs):
 
         resp = auth_views.login(request, template_name='accounts/login.html', authentication_form=MyAuthenticationForm)
-        if not request.user.groups.filter(name='admin').exists() and str(request.user) != 'AnonymousUser':
-            try:
-                sp = SalesPerson.objects.get(user=request.user)
-            except:
+        # The user has just logged in, so the context of the anonymous user is out of date
+        request.crm_user = get_user_context(request, refresh=True)
+        if not request.crm_user.is_admin and request.user.is_authenticated():
+            if not request.crm_user.has_sales_person:
                 messages.error(request, _("Учетная запись пользователя должна быть связанна с записью персонала"
                                           " или иметь статус АДМИНИСТРАТОРА."))
                 logout(request)
@@ -145,9 +133,8 @@ class MyLogin(TemplateView, SomeUtilsMixin):
 
     def get(self, request, *args, **kwargs):
         # Set language as is tenant language
-        rec = Client.objects.get(pk=request.tenant.pk)
         translation.deactivate_all()
-        translation.activate(rec.lang)
+        translation.activate(request.tenant_lang)
         # if the form updated we need to clear message query
         self.clearMsg(request)
         resp = auth_views.login(request, template_name='accounts/login.html', authentication_form=MyAuthenticationForm)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Bulk import of customers from CSV ( upload form and "python manage.py import_customers" ).
+# Every row is checked by the validators of the Customer model ( phone numbers, e-mail, choices, date ),
+# valid rows are inserted by bulk_create batches in one transaction, bad rows are reported and skipped.
+
+import csv
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from crm.models import Customer, SalesPerson
+from simpleCRM import settings
+
+# Columns of the file, the first line of the file must be the header with these names.
+# sales_person ( id ) may be missed, then the default sales person is used. Rows imported by a manager
+# with row scoping ( owner ) always belong to the manager, the column is ignored
+COLUMNS = ('first_name', 'second_name', 'company', 'position', 'phone_number', 'mobile_number', 'email_address',
+           'brith_data', 'status', 'comment', 'sales_person')
+
+
+def read_rows(lines):
+    '''
+    Rows of the CSV as dicts of the known columns with the line numbers.
+
+    >>> list(read_rows(['first_name,second_name,unknown', 'A,B,x', '', ' C ,D']))
+    [(2, {'first_name': 'A', 'second_name': 'B'}), (4, {'first_name': 'C', 'second_name': 'D'})]
+    '''
+    reader = csv.DictReader(lines)
+    for row in reader:
+        data = {name: (value or '').strip() for name, value in row.items() if name in COLUMNS}
+        if any(data.values()):
+            yield reader.line_num, data
+
+
+def build_customer(data, sales_persons, default_sales_person=None, owner=None):
+    '''
+    Unsaved Customer from one row, ValidationError if the row is bad.
+    sales_persons is the set of existing SalesPerson ids, so the rows do not make a query each.
+    '''
+    data = dict(data)
+    sales_person_id = data.pop('sales_person', '') or default_sales_person
+    if owner is not None:
+        sales_person_id = owner
+    try:
+        sales_person_id = int(sales_person_id)
+    except (TypeError, ValueError):
+        raise ValidationError({'sales_person': [str(sales_person_id or '')]})
+    if sales_person_id not in sales_persons:
+        raise ValidationError({'sales_person': [str(sales_person_id)]})
+    data['brith_data'] = data.get('brith_data') or None
+
+    customer = Customer(sales_person_id=sales_person_id, **data)
+    # sales_person is checked above, avatar can not be imported
+    customer.full_clean(exclude=['sales_person', 'avatar'])
+    customer.normalize_phones()
+    return customer
+
+
+def import_customers(lines, default_sales_person=None, batch_size=None, owner=None):
+    '''
+    Import customers from the CSV lines ( file opened in text mode or a list of strings ).
+    With owner ( SalesPerson id ) all customers belong to it whatever the sales_person column is.
+    Return the number of created customers and the list of errors: (line number, {field: [messages]}).
+    '''
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    sales_persons = set(SalesPerson.objects.values_list('id', flat=True))
+    created = 0
+    errors = []
+    batch = []
+    with transaction.atomic():
+        for line, data in read_rows(lines):
+            try:
+                batch.append(build_customer(data, sales_persons, default_sales_person, owner))
+            except ValidationError as error:
+                errors.append((line, error.message_dict))
+                continue
+            if len(batch) >= batch_size:
+                Customer.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            Customer.objects.bulk_create(batch)
+            created += len(batch)
+    return created, errors
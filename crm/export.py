@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Streaming CSV export of the list tables.
+# Rows are written to the response while they are read from the database in pk ordered chunks,
+# so the memory of the worker does not depend on the number of exported rows.
+
+import csv
+
+from django.core.exceptions import FieldDoesNotExist
+from django.http import StreamingHttpResponse
+
+from crm.tables import project_queryset
+from simpleCRM import settings
+
+
+class Echo(object):
+    # Pseudo buffer for csv.writer: writerow() returns the line instead of keeping it
+    def write(self, value):
+        return value
+
+
+def chunked(queryset, chunk_size=None):
+    '''
+    Iterate over the queryset by chunks of pk ordered rows ( WHERE pk > last pk LIMIT chunk_size ).
+    QuerySet.iterator() of Django 1.9 has no server-side cursor, psycopg2 reads all the result into memory,
+    so a big export is split into small queries instead.
+    '''
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size].iterator())
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            break
+        last_pk = rows[-1].pk
+
+
+def cell_value(table, column, record):
+    # Plain text of the cell: choices are shown by labels, render_FOO(value) of the table is used if any
+    value = column.accessor.resolve(record, quiet=True)
+    try:
+        field = record._meta.get_field(column.name)
+        if field.choices:
+            value = dict(field.flatchoices).get(value, value)
+    except FieldDoesNotExist:
+        pass
+    render = getattr(table, 'render_' + column.name, None)
+    if render:
+        value = render(value)
+    return '' if value is None else str(value)
+
+
+def csv_rows(table, queryset, chunk_size=None):
+    '''
+    Lines of CSV: the header ( verbose names of the visible columns ) and one line per row of the queryset.
+    '''
+    writer = csv.writer(Echo())
+    columns = [column for column in table.columns if column.name not in getattr(table, 'export_exclude', ())]
+    # BOM, so Excel opens the file in UTF-8
+    yield '\ufeff' + writer.writerow([str(column.header) for column in columns])
+    for record in chunked(queryset, chunk_size):
+        yield writer.writerow([cell_value(table, column, record) for column in columns])
+
+
+def export_table(table_class, queryset, name):
+    '''
+    Streaming CSV response with the rows of the filtered queryset shown as the table_class.
+    '''
+    queryset = project_queryset(table_class(queryset), queryset)
+    table = table_class(queryset)
+    response = StreamingHttpResponse(csv_rows(table, queryset), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="%s.csv"' % name
+    return response
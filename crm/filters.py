@@ -30,9 +30,10 @@ class DealFilter(django_filters.FilterSet):
     deal_data.widget.widgets[0] = DateWidget(attrs={'id': "yourdateid"}, usel10n=True, bootstrap_version=3)
     deal_data.widget.widgets[1] = DateWidget(attrs={'id': "yourdateid"}, usel10n=True, bootstrap_version=3)
 
+    # The queryset must be annotated with deal_status ( see Deal.objects.with_latest_status )
     def filter_deal(self, queryset, name, value):
         if value != 'Z':
-            queryset = queryset.filter(dealstatus__status__exact=value)
+            queryset = queryset.filter(deal_status__exact=value)
 
         return queryset
 
@@ -56,11 +57,10 @@ class DealFilterWithoutData(django_filters.FilterSet):
     label = DealStatus._meta.get_field('status').verbose_name.title()
     status = django_filters.ChoiceFilter(choices=STATUS_CHOICES, method='filter_deal', label=label)
 
+    # The queryset must be annotated with deal_status ( see Deal.objects.with_latest_status )
     def filter_deal(self, queryset, name, value):
-        if value == 'Z':
-            queryset = Deal.objects.all()
-        else:
-            queryset = queryset.filter(status__exact=value)
+        if value != 'Z':
+            queryset = queryset.filter(deal_status__exact=value)
 
         return queryset
 
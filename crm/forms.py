@@ -128,16 +128,62 @@ class DealProductForm(forms.ModelForm):
     class Meta:
         model = DealProducts
         fields = '__all__'
+        # Search goes to the indexed and cached crm.views.product_views.product_search,
+        # the queryset is used only to show the chosen product
         widgets = {'product': ModelSelect2Widget(
-            model=DealProducts, search_fields=['description__icontains'],
-            queryset=Product.objects.all())}
+            model=Product, search_fields=['description__icontains'],
+            queryset=Product.objects.all(), data_view='product_search')}
 
 
 class DealStatusForm(forms.ModelForm):
     class Meta:
         model = DealStatus
         fields = '__all__'
+        # There is no fixed id, so every form of a formset gets its own id from the form prefix
+        # ( id_status-0-deal_data, id_status-1-deal_data ... ) when the field is rendered in the template
         widgets = {
-            'deal_data': DateWidget(attrs={'id': "yourdateid"}, usel10n=True, bootstrap_version=3),
-            'deal_time': TimeWidget(attrs={'id': "yourtimeid"}, usel10n=True, bootstrap_version=3)
+            'deal_data': DateWidget(usel10n=True, bootstrap_version=3),
+            'deal_time': TimeWidget(usel10n=True, bootstrap_version=3)
         }
+
+
+# Form without model. Chart settings for the reports
+class ChartForm(forms.Form):
+    GRANULARITY_CHOICES = (
+        ('', _('Равные интервалы')),
+        ('day', _('День')),
+        ('week', _('Неделя')),
+        ('month', _('Месяц')),
+    )
+
+    buckets = forms.IntegerField(label=_('Количество точек'), min_value=2, max_value=366, initial=20, required=False)
+    granularity = forms.ChoiceField(label=_('Интервал'), choices=GRANULARITY_CHOICES, required=False)
+
+
+# Form without model. Funnel settings for the reports
+class FunnelForm(forms.Form):
+    ever_reached = forms.BooleanField(label=_('Учитывать всю историю статусов'), required=False,
+                                      help_text=_('<h5><small>Сделка учитывается на каждом этапе, '
+                                                  'который она когда-либо проходила</small></h5>'))
+
+
+# Forms without model. Parameters of "last N days" and "custom period" pre-filters of deals and todos
+class LastDaysForm(forms.Form):
+    days = forms.IntegerField(label=_('Количество дней'), min_value=1, max_value=3660, initial=7, required=False)
+
+
+class PeriodForm(forms.Form):
+    date_from = forms.DateField(label=_('С'), required=False,
+                                widget=DateWidget(attrs={'id': "perioddatefrom"}, usel10n=True, bootstrap_version=3))
+    date_to = forms.DateField(label=_('По'), required=False,
+                              widget=DateWidget(attrs={'id': "perioddateto"}, usel10n=True, bootstrap_version=3))
+
+
+# Form without model. CSV file of customers for the bulk import ( see crm.customer_import )
+class CustomerImportForm(forms.Form):
+    file = forms.FileField(label=_('Файл CSV'),
+                           help_text=_('<h5><small>Первая строка - названия колонок: first_name, second_name, company, '
+                                       'position, phone_number, mobile_number, email_address, brith_data, status, '
+                                       'comment, sales_person</small></h5>'))
+    sales_person = forms.ModelChoiceField(queryset=SalesPerson.objects.all(), label=_('Менеджер'), required=False,
+                                          help_text=_('<h5><small>Для строк без колонки sales_person</small></h5>'))
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+from django.core.management import BaseCommand
+from django.db import connection
+from tenant_schemas.utils import schema_context, get_tenant_model
+
+from crm.models import Customer, SalesPerson, PHONE_DIGITS
+
+# The same as crm.models.normalize_phone, by one UPDATE per table on the database server
+BACKFILL = '''
+    UPDATE {table} SET phone_digits = right(regexp_replace(phone_number, '\\D', '', 'g'), {digits}),
+                       mobile_digits = right(regexp_replace(mobile_number, '\\D', '', 'g'), {digits})
+'''
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Fill normalized phone numbers ( phone_digits, mobile_digits ) of customers and sales persons" \
+           " in every tenant schema. Usage: python manage.py backfill_phone_digits [schema_name ...]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        schemas = options['schemas']
+        if not schemas:
+            schemas = get_tenant_model().objects.exclude(schema_name='public').values_list('schema_name', flat=True)
+
+        for schema in schemas:
+            with schema_context(schema), connection.cursor() as cursor:
+                for model in (Customer, SalesPerson):
+                    cursor.execute(BACKFILL.format(table=model._meta.db_table, digits=PHONE_DIGITS))
+                    self.stdout.write('Schema ' + str(schema) + ': ' + str(cursor.rowcount) + ' ' +
+                                      model._meta.model_name + ' rows updated')
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import timeit
+
+from datetimewidget.widgets import DateWidget, TimeWidget
+from django.core.management import BaseCommand
+from django.forms import modelformset_factory
+from django.template import Template, Context
+
+from crm.forms import DealStatusForm
+from crm.models import DealStatus
+from crm.views.deal_views import StatusFormset
+
+# The same status rows as crm/deal.html renders
+TEMPLATE = Template('''{% load bootstrap %}{% for ff in formset_status %}
+    {{ ff.status|bootstrap }} {{ ff.deal_data|bootstrap }} {{ ff.deal_time|bootstrap }} {{ ff.remark|bootstrap }}
+    {{ ff.DELETE }} {% for ff_field in ff.hidden_fields %}{{ ff_field }}{% endfor %}
+{% endfor %}''')
+
+
+def status_data(rows):
+    # Bound data of a formset with many status rows. Rows have no ids, so no DB queries are needed
+    data = {'status-TOTAL_FORMS': str(rows), 'status-INITIAL_FORMS': '0',
+            'status-MIN_NUM_FORMS': '0', 'status-MAX_NUM_FORMS': '1000'}
+    for i in range(rows):
+        data['status-%d-status' % i] = 'E'
+        data['status-%d-deal_data' % i] = '2017-01-%02d' % (i % 28 + 1)
+        data['status-%d-deal_time' % i] = '10:%02d' % (i % 12 * 5)
+        data['status-%d-remark' % i] = 'remark %d' % i
+    return data
+
+
+def render_before(data):
+    # How DealUpdateView did it: the formset class per request and new datetime widgets for every row
+    formset_class = modelformset_factory(model=DealStatus, form=DealStatusForm, extra=1, can_delete=True)
+    formset = formset_class(data, prefix='status')
+    for i, f in enumerate(formset):
+        f.fields['deal_data'].widget = DateWidget(attrs={'id': 'yourdateid' + str(i)}, usel10n=True,
+                                                  bootstrap_version=3)
+        f.fields['deal_time'].widget = TimeWidget(attrs={'id': 'yourtimeid' + str(i)}, usel10n=True,
+                                                  bootstrap_version=3)
+    return TEMPLATE.render(Context({'formset_status': formset}))
+
+
+def render_after(data):
+    formset = StatusFormset(data, prefix='status')
+    return TEMPLATE.render(Context({'formset_status': formset}))
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Micro-benchmark of the status formset rendering of the deal edit page." \
+           " Usage: python manage.py bench_deal_render [--rows 200] [--repeat 10]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        data = status_data(options['rows'])
+        repeat = options['repeat']
+
+        # warm up template and translation caches
+        render_before(data)
+        render_after(data)
+
+        before = min(timeit.repeat(lambda: render_before(data), number=1, repeat=repeat))
+        after = min(timeit.repeat(lambda: render_after(data), number=1, repeat=repeat))
+
+        self.stdout.write('Status rows: ' + str(options['rows']))
+        self.stdout.write('Before ( factory per request, widgets per row ): %.1f ms' % (before * 1000))
+        self.stdout.write('After ( cached formset classes ):                %.1f ms' % (after * 1000))
+        self.stdout.write('Speedup: %.2fx' % (before / after if after else 0))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import multiprocessing
+import os
+
+from django.core.management import BaseCommand
+from tenant_schemas.utils import get_tenant_model
+
+from crm.schema_dump import dump_schema_worker, close_connections
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Dump tenant schemas to JSON Lines files ( one file per model ) by parallel processes." \
+           " Usage: python manage.py export_schemas --dir DIR [--workers N] [--gzip] [schema_name ...]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+        # no default: a dump holds customers data and must not land in the source tree
+        parser.add_argument('--dir', dest='directory', type=str, required=True)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--gzip', action='store_true', default=False)
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        schemas = options['schemas']
+        if not schemas:
+            schemas = list(get_tenant_model().objects.exclude(schema_name='public')
+                           .values_list('schema_name', flat=True))
+
+        tasks = [(schema, options['directory'], options['gzip'], options['chunk_size']) for schema in schemas]
+        workers = max(1, min(options['workers'], len(tasks)))
+        self.stdout.write('Dump ' + str(len(tasks)) + ' schemas to ' + options['directory'] +
+                          ' by ' + str(workers) + ' processes')
+
+        close_connections()
+        pool = multiprocessing.Pool(workers, initializer=close_connections)
+        try:
+            for done, (schema, counts, seconds) in enumerate(pool.imap_unordered(dump_schema_worker, tasks), 1):
+                self.stdout.write('[%s/%s] Schema %s: %s models, %s rows in %.1f s' %
+                                  (done, len(tasks), schema, len(counts), sum(counts.values()), seconds))
+        finally:
+            pool.close()
+            pool.join()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import io
+import time
+
+from django.core.management import BaseCommand, CommandError
+from tenant_schemas.utils import schema_context
+
+from crm.customer_import import import_customers
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Import customers from CSV file into a tenant schema." \
+           " Usage: python manage.py import_customers schema_name file.csv [--sales-person ID] [--owner ID] [--batch-size N]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schema', type=str)
+        parser.add_argument('file', type=str)
+        parser.add_argument('--sales-person', dest='sales_person', type=int, default=None,
+                            help='SalesPerson id for the rows without sales_person column')
+        parser.add_argument('--owner', dest='owner', type=int, default=None,
+                            help='SalesPerson id of a manager with row scoping, all rows will belong to him')
+        parser.add_argument('--batch-size', dest='batch_size', type=int, default=None)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        start = time.time()
+        with io.open(options['file'], encoding='utf-8-sig', newline='') as lines:
+            with schema_context(options['schema']):
+                try:
+                    created, errors = import_customers(lines, options['sales_person'], options['batch_size'],
+                                                       options['owner'])
+                except UnicodeDecodeError as error:
+                    raise CommandError('The file must be in UTF-8, nothing is imported: ' + str(error))
+
+        for line, messages in errors:
+            self.stderr.write('Line ' + str(line) + ': ' + '; '.join(
+                field + ': ' + ', '.join(field_errors) for field, field_errors in messages.items()))
+        self.stdout.write('Schema ' + options['schema'] + ': ' + str(created) + ' customers created, ' +
+                          str(len(errors)) + ' rows skipped in %.1f s' % (time.time() - start))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import datetime
+
+from django.core.management import BaseCommand, CommandError
+from tenant_schemas.utils import schema_context, get_tenant_model
+
+from crm.models import DailySales
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Date must be in YYYY-MM-DD format: ' + value)
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Rebuild daily sales rollup for a date range in every tenant schema." \
+           " Usage: python manage.py rebuild_daily_sales [--from YYYY-MM-DD] [--to YYYY-MM-DD] [schema_name ...]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+        parser.add_argument('--from', dest='date_from', type=parse_date, default=None)
+        parser.add_argument('--to', dest='date_to', type=parse_date, default=None)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        schemas = options['schemas']
+        if not schemas:
+            schemas = get_tenant_model().objects.exclude(schema_name='public').values_list('schema_name', flat=True)
+
+        for schema in schemas:
+            with schema_context(schema):
+                created = DailySales.objects.rebuild(date_from=options['date_from'], date_to=options['date_to'])
+            self.stdout.write('Schema ' + str(schema) + ': ' + str(created) + ' rollup rows created')
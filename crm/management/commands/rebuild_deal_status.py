@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from tenant_schemas.utils import schema_context, get_tenant_model
+
+from crm.models import Deal, DealStatus
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Rebuild Deal.current_status* from DealStatus history in every tenant schema." \
+           " Usage: python manage.py rebuild_deal_status [schema_name ...]"
+
+    # positional arguments
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        schemas = options['schemas']
+        if not schemas:
+            schemas = get_tenant_model().objects.exclude(schema_name='public').values_list('schema_name', flat=True)
+
+        for schema in schemas:
+            with schema_context(schema):
+                updated = self.rebuild()
+            self.stdout.write('Schema ' + str(schema) + ': ' + str(updated) + ' deals updated')
+
+    def rebuild(self):
+        deal_table = Deal._meta.db_table
+        status_table = DealStatus._meta.db_table
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Deals without any status
+            cursor.execute('UPDATE {deal} SET current_status = NULL, current_status_date = NULL, '
+                           'current_status_time = NULL WHERE current_status IS NOT NULL AND NOT EXISTS '
+                           '(SELECT 1 FROM {status} s WHERE s.deal_id = {deal}.id)'
+                           .format(deal=deal_table, status=status_table))
+            # The newest status of every deal in one pass over the history
+            cursor.execute('UPDATE {deal} d SET current_status = s.status, current_status_date = s.deal_data, '
+                           'current_status_time = s.deal_time '
+                           'FROM (SELECT DISTINCT ON (deal_id) deal_id, status, deal_data, deal_time FROM {status} '
+                           'WHERE deal_id IS NOT NULL ORDER BY deal_id, deal_data DESC, deal_time DESC, id DESC) s '
+                           'WHERE s.deal_id = d.id'.format(deal=deal_table, status=status_table))
+            return cursor.rowcount
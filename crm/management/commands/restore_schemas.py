@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import multiprocessing
+import os
+
+from django.core.management import BaseCommand, CommandError
+
+from crm.schema_dump import restore_schema_worker, close_connections
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Restore tenant schemas from the dump of export_schemas by parallel processes." \
+           " All data of a restored schema is replaced, the tenant ( schema ) must already exist." \
+           " Usage: python manage.py restore_schemas --dir DIR [--workers N] [schema_name ...]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+        # no default: a dump holds customers data and must not land in the source tree
+        parser.add_argument('--dir', dest='directory', type=str, required=True)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        directory = options['directory']
+        schemas = options['schemas']
+        if not schemas:
+            # every schema of the dump
+            schemas = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+        if 'public' in schemas:
+            raise CommandError('The public schema can not be restored by this command')
+        for schema in schemas:
+            if not os.path.isdir(os.path.join(directory, schema)):
+                raise CommandError('There is no dump of the schema ' + schema + ' in ' + directory)
+
+        tasks = [(schema, directory, options['chunk_size']) for schema in schemas]
+        workers = max(1, min(options['workers'], len(tasks)))
+        self.stdout.write('Restore ' + str(len(tasks)) + ' schemas from ' + directory +
+                          ' by ' + str(workers) + ' processes')
+
+        failed = 0
+        close_connections()
+        pool = multiprocessing.Pool(workers, initializer=close_connections)
+        try:
+            results = pool.imap_unordered(restore_schema_worker, tasks)
+            for done, (schema, counts, seconds, error) in enumerate(results, 1):
+                if error:
+                    failed += 1
+                    self.stderr.write('[%s/%s] Schema %s is not restored: %s' % (done, len(tasks), schema, error))
+                else:
+                    self.stdout.write('[%s/%s] Schema %s: %s models, %s rows in %.1f s' %
+                                      (done, len(tasks), schema, len(counts), sum(counts.values()), seconds))
+        finally:
+            pool.close()
+            pool.join()
+
+        if failed:
+            raise CommandError(str(failed) + ' schemas are not restored')
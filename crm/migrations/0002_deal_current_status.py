@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Fill current_status* for the deals already present in the schema
+FILL_CURRENT_STATUS = '''
+    UPDATE crm_deal d SET current_status = s.status, current_status_date = s.deal_data,
+                          current_status_time = s.deal_time
+    FROM (SELECT DISTINCT ON (deal_id) deal_id, status, deal_data, deal_time FROM crm_dealstatus
+          WHERE deal_id IS NOT NULL ORDER BY deal_id, deal_data DESC, deal_time DESC, id DESC) s
+    WHERE s.deal_id = d.id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='deal',
+            name='current_status',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=1, null=True, verbose_name='Status'),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='current_status_date',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True, verbose_name='Date'),
+        ),
+        migrations.AddField(
+            model_name='deal',
+            name='current_status_time',
+            field=models.TimeField(blank=True, editable=False, null=True, verbose_name='Time'),
+        ),
+        migrations.RunSQL(FILL_CURRENT_STATUS, migrations.RunSQL.noop),
+    ]
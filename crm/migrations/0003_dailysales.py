@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_deal_current_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(db_index=True, verbose_name='Date')),
+                ('status', models.CharField(choices=[('E', 'First contact'), ('D', 'Make decision'), ('H', 'Согласование контракта'), ('S', 'Contract signed'), ('P', 'Waiting for many'), ('O', 'Contract has done'), ('A', 'Dead contract')], max_length=1, verbose_name='Status')),
+                ('deal_count', models.PositiveIntegerField(default=0, verbose_name='Deals qty')),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total price')),
+                ('entered_count', models.PositiveIntegerField(default=0, verbose_name='Entered the stage')),
+                ('entered_price', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Price of entered the stage')),
+                ('sales_person', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crm.SalesPerson', verbose_name='Manager')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales',
+                'verbose_name': 'Sales of the day',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailysales',
+            unique_together=set([('date', 'sales_person', 'status')]),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0003_dailysales'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='todo',
+            index_together=set([('sales_person', 'todo_data')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='deal',
+            index_together=set([('sales_person', 'current_status_date')]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Indexes of the product search ( Product.objects.search ): prefix of sku as text and trigram of description.
+    pg_trgm is created in the public schema, so its operator classes are seen from every tenant schema.
+    """
+
+    dependencies = [
+        ('crm', '0004_date_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX crm_product_sku_prefix ON crm_product ((CAST(sku AS text)) text_pattern_ops)',
+            reverse_sql='DROP INDEX crm_product_sku_prefix',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX crm_product_description_trgm ON crm_product USING gin (description gin_trgm_ops)',
+            reverse_sql='DROP INDEX crm_product_description_trgm',
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# search_vector columns ( tsvector ) of customers, deals and todos for crm.search.
+# The columns are not model fields: they are never loaded by the ORM and are filled by BEFORE INSERT OR UPDATE
+# triggers, so bulk_create, the CSV import and the restore of schemas keep them current as well as save().
+# The trigger functions are the same for all tenants and live in the public schema,
+# the columns, triggers and GIN indexes are created in every tenant schema.
+
+
+def search_vector_sql(table, expression):
+    return [
+        'ALTER TABLE {table} ADD COLUMN search_vector tsvector'.format(table=table),
+        'CREATE OR REPLACE FUNCTION public.{table}_search_vector() RETURNS trigger AS $$ '
+        'BEGIN NEW.search_vector := {expression}; RETURN NEW; END $$ LANGUAGE plpgsql'.format(
+            table=table, expression=expression),
+        'CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE ON {table} '
+        'FOR EACH ROW EXECUTE PROCEDURE public.{table}_search_vector()'.format(table=table),
+        # fill the existing rows by the trigger
+        'UPDATE {table} SET id = id'.format(table=table),
+        'CREATE INDEX {table}_search_vector ON {table} USING gin (search_vector)'.format(table=table),
+    ]
+
+
+def drop_search_vector_sql(table):
+    # The function is left, other tenant schemas may use it
+    return [
+        'DROP TRIGGER {table}_search_vector ON {table}'.format(table=table),
+        'ALTER TABLE {table} DROP COLUMN search_vector'.format(table=table),
+    ]
+
+
+CUSTOMER = ("setweight(to_tsvector('simple', coalesce(NEW.first_name, '') || ' ' || coalesce(NEW.second_name, '')),"
+            " 'A') || setweight(to_tsvector('simple', coalesce(NEW.company, '') || ' ' || coalesce(NEW.email_address, '')"
+            " || ' ' || coalesce(NEW.phone_number, '') || ' ' || coalesce(NEW.mobile_number, '')), 'B')"
+            " || setweight(to_tsvector('simple', coalesce(NEW.position, '') || ' ' || coalesce(NEW.comment, '')), 'D')")
+
+DEAL = ("setweight(to_tsvector('simple', NEW.ident::text), 'A')"
+        " || setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B')")
+
+TODO = "to_tsvector('simple', coalesce(NEW.action_description, ''))"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(search_vector_sql('crm_customer', CUSTOMER), drop_search_vector_sql('crm_customer')),
+        migrations.RunSQL(search_vector_sql('crm_deal', DEAL), drop_search_vector_sql('crm_deal')),
+        migrations.RunSQL(search_vector_sql('crm_todo', TODO), drop_search_vector_sql('crm_todo')),
+    ]
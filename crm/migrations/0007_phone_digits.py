@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Numbers already present in the schema are normalized by "python manage.py backfill_phone_digits"
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_full_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='mobile_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='salesperson',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='salesperson',
+            name='mobile_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=10),
+        ),
+    ]
@@ -1,27 +1,66 @@
 # -*- coding: utf-8 -*-#
 
+import datetime
+
 from django.contrib import messages
-from django.contrib.auth.models import User
 from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 
-from crm.models import DealStatus
-from simpleCRM import settings
+from crm.permissions import has_perm, scope_queryset
+
 
 __author__ = 'AMA'
 
 
+# Objects of the detail, update and delete views are looked up only in the rows of the user ( settings.ROW_SCOPING )
+class ScopedQuerysetMixin(object):
+    def get_queryset(self):
+        return scope_queryset(self.request, super().get_queryset())
+
+
 # The decorator, than choose a language in dependence from a user preferred language
 def add_lang(view):
     def f(request, *args, **kwargs):
-        try:
-            translation.activate(request.user.salesperson.lang)
-        except:
-            translation.activate(settings.MY_LANG_CODE)
+        translation.activate(request.crm_user.lang)
         return view(request, *args, **kwargs)
     return f
 
 
+def period_range(duration, params=None, today=None):
+    """
+    Half-open date range [start, end) for the pre-filters of deals and todos. Range ( unlike __year, __month
+    and __day extracts ) can use a plain B-tree index on the date column. Any bound may be None.
+
+    duration - 'day', 'month', 'year', 'last' ( params['days'] days up to today ) or 'period'
+    ( params['date_from'] and params['date_to'] both including ).
+
+    >>> period_range('month', today=datetime.date(2017, 12, 15))
+    (datetime.date(2017, 12, 1), datetime.date(2018, 1, 1))
+    >>> period_range('last', {'days': 7}, today=datetime.date(2017, 3, 1))
+    (datetime.date(2017, 2, 23), datetime.date(2017, 3, 2))
+    >>> period_range('period', {'date_from': None, 'date_to': datetime.date(2017, 3, 1)})
+    (None, datetime.date(2017, 3, 2))
+    """
+    today = today or datetime.date.today()
+    params = params or {}
+    one_day = datetime.timedelta(days=1)
+
+    if duration == 'day':
+        return today, today + one_day
+    if duration == 'month':
+        start = today.replace(day=1)
+        return start, (start + datetime.timedelta(days=31)).replace(day=1)
+    if duration == 'year':
+        return today.replace(month=1, day=1), today.replace(year=today.year + 1, month=1, day=1)
+    if duration == 'last':
+        days = params.get('days') or 7
+        return today - datetime.timedelta(days=days - 1), today + one_day
+    if duration == 'period':
+        date_from, date_to = params.get('date_from'), params.get('date_to')
+        return date_from, date_to + one_day if date_to else None
+    return None, None
+
+
 # It's only set of useful utils for CRUD classes
 class SomeUtilsMixin():
     # If we don't clear storage of message's that old message's showed
@@ -33,28 +72,13 @@ class SomeUtilsMixin():
             except:
                 pass
 
-    # Check permissions for model and object both
+    # Check permissions for model and object both. Object permissions need only pk, the record is not loaded
     def checkPermissions(self, request, model, perm):
-        rec = model.objects.get(pk=self.kwargs['pk'])
-        user = User.objects.get(username=str(request.user))
-        has_perm = user.has_perm(perm, rec)
-        has_perm_group = user.has_perm(perm)
-        if not has_perm and not has_perm_group:
+        if not has_perm(request, perm, model(pk=self.kwargs['pk'])):
             messages.error(request, _(' У Вашего аккаунта не хватает прав для совершения этой операции'))
             return False
         else:
             return True
 
-    # Change jne letter code on hunan readable text
-    def doHumanReadble_STATUS_CHOICES(self, queryset):
-        for query in queryset:
-            for status in DealStatus.STATUS_CHOICES:
-                if query.deal_status == status[0]:
-                    query.deal_status = status[1]
-        return queryset
-
     def set_lang(self, request):
-        try:
-            translation.activate(request.user.salesperson.lang)
-        except:
-            translation.activate(settings.MY_LANG_CODE)
+        translation.activate(request.crm_user.lang)
@@ -1,15 +1,35 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q, Count, Sum
 from django.core.validators import RegexValidator, MinValueValidator
 from django.contrib.auth.models import User
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext as __
 from decimal import Decimal
+import re
 
 # how to override the verbose name of a superclass model field in django
 # http://stackoverflow.com/questions/927729/how-to-override-the-verbose-name-of-a-superclass-model-field-in-django
 User._meta.get_field('is_staff').verbose_name = _('персонал')
 User._meta.get_field('is_superuser').verbose_name = _('админ.')
 
+# Significant digits of a phone number. The validator of Person allows an optional country code,
+# so only the last ones are kept and "+7 (123) 456 7899" is the same number as "123-456-7899"
+PHONE_DIGITS = 10
+
+
+def normalize_phone(number):
+    """
+    Digits of the phone number in any format, for the exact lookup by the indexed *_digits columns.
+    The backfill_phone_digits command does the same in SQL: right(regexp_replace(number, '\\D', '', 'g'), 10)
+
+    >>> normalize_phone('(123) 456 7899'), normalize_phone('+7 123-456-7899'), normalize_phone('123.456.7899')
+    ('1234567899', '1234567899', '1234567899')
+    >>> normalize_phone('')
+    ''
+    """
+    return re.sub(r'\D', '', number or '')[-PHONE_DIGITS:]
+
+
 class Person(models.Model):  # ABS class define abstract Person
 
     first_name = models.CharField(max_length=100, verbose_name=_('Фамилия'))
@@ -26,9 +46,22 @@ class Person(models.Model):  # ABS class define abstract Person
     # upload_to - URL относительно MEDIA_URL
     avatar = models.ImageField(upload_to='crm/', blank=True, verbose_name=_('Фотография'))
 
+    # Normalized copies of the numbers ( see normalize_phone ) for the lookup by caller ID, filled on save
+    phone_digits = models.CharField(max_length=PHONE_DIGITS, blank=True, editable=False, db_index=True)
+    mobile_digits = models.CharField(max_length=PHONE_DIGITS, blank=True, editable=False, db_index=True)
+
     class Meta:
         abstract = True
 
+    def normalize_phones(self):
+        # bulk_create does not call save(), so the import calls it itself
+        self.phone_digits = normalize_phone(self.phone_number)
+        self.mobile_digits = normalize_phone(self.mobile_number)
+
+    def save(self, *args, **kwargs):
+        self.normalize_phones()
+        super().save(*args, **kwargs)
+
 
 '''
 В Django есть четыре способа изменить модель User:
@@ -97,6 +130,7 @@ class Todo(models.Model):
         verbose_name = _('Список дел')
         verbose_name_plural = _('Всего дел')
         permissions = (('read_todo', _('Просмотр дел')),)
+        index_together = (("sales_person", "todo_data"),)
 
     def __str__(self):
         return '%s' % (self.action_description)
@@ -130,6 +164,22 @@ class Customer(Person):
         return '%s %s' % (self.first_name, self.second_name)
 
 
+class DealQuerySet(models.QuerySet):
+
+    def with_latest_status(self):
+        """
+        Extend every deal with data of its newest DealStatus ( by deal_data, deal_time ).
+
+        The newest status is stored in the deal itself ( current_status* fields, kept in sync by crm.signals ),
+        so it is a plain scan of the deal table without any join with the status history.
+        Deals without any status are kept with empty deal_data, deal_time and deal_status.
+        """
+        queryset = self.annotate(deal_data=F('current_status_date'))
+        queryset = queryset.annotate(deal_time=F('current_status_time'))
+        queryset = queryset.annotate(deal_status=F('current_status'))
+        return queryset
+
+
 class Deal(models.Model):
 
     sales_person = models.ForeignKey(SalesPerson, verbose_name=_('Менеджер'))  # Many-to-One relation
@@ -143,20 +193,58 @@ class Deal(models.Model):
     ident = models.PositiveIntegerField(_('Номер контракта'), unique=True)
     description = models.TextField(verbose_name=_('Описание'))
 
+    # Copy of the newest DealStatus of this deal. Don't edit it manually, see crm.signals
+    current_status = models.CharField(_('Статус'), max_length=1, blank=True, null=True, editable=False,
+                                      db_index=True)
+    current_status_date = models.DateField(_('Дата'), blank=True, null=True, editable=False, db_index=True)
+    current_status_time = models.TimeField(_('Время'), blank=True, null=True, editable=False)
+
+    objects = DealQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Сделка')
         verbose_name_plural = _('Всего сделок')
         permissions = ( ('read_deal', _('Просмотр контрактов')),)
+        index_together = (("sales_person", "current_status_date"),)
 
     def __str__(self):
         return '%s' % (self.ident)
 
+    def refresh_current_status(self):
+        """
+        Copy the newest DealStatus into current_status* fields. UPDATE is used instead of save()
+        to avoid overwriting other fields by a stale instance.
+        """
+        latest = DealStatus.objects.filter(deal=self.pk).order_by('-deal_data', '-deal_time', '-id').first()
+        self.current_status = latest.status if latest else None
+        self.current_status_date = latest.deal_data if latest else None
+        self.current_status_time = latest.deal_time if latest else None
+        Deal.objects.filter(pk=self.pk).update(current_status=self.current_status,
+                                               current_status_date=self.current_status_date,
+                                               current_status_time=self.current_status_time)
+
+
+class ProductQuerySet(models.QuerySet):
+    def search(self, term):
+        """
+        Products whose sku starts with the term or description contains it ( case insensitive ).
+        Both conditions are served by indexes of migration 0005: the text_pattern_ops index on sku as text and
+        the trigram ( pg_trgm ) GIN index on description. The SQL must match the index expressions,
+        so it is written by extra() instead of __startswith / __icontains lookups.
+        """
+        table = self.model._meta.db_table
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where = ['(CAST(%s.sku AS text) LIKE %%s OR %s.description ILIKE %%s)' % (table, table)]
+        return self.extra(where=where, params=[escaped + '%', '%' + escaped + '%'])
+
 
 class Product(models.Model):
     sku = models.IntegerField(_('Номер товара'), unique=True)
     description = models.TextField(_('Наименование товара'), unique=True)
     price = models.PositiveIntegerField(_('Цена'),default=0)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = _('Продукт')
         verbose_name_plural = _('Всего продуктов')
@@ -211,9 +299,110 @@ class DealStatus(models.Model):
     class Meta:
         verbose_name = _('Статус контракта')
         verbose_name_plural = _('Статусы контракта')
+        # The unique index on (deal, deal_data, deal_time) also serves the search of the latest status
         unique_together = (("deal","deal_data", "deal_time"),)
         permissions = (('read_salesperson', _('Просмотр статуса контракта')),)
 
 
     def __str__(self):
         return '%s' % (self.status)
+
+
+class DailySalesQuerySet(models.QuerySet):
+
+    def rebuild(self, keys=None, date_from=None, date_to=None):
+        """
+        Recompute rollup rows from deals and their status history.
+
+        keys - iterable of (sales_person_id, date) to recompute ( incremental update, see crm.signals ),
+        otherwise all rows between date_from and date_to ( both optional ) are recomputed.
+        The SalesPerson rows of the keys are locked first, so concurrent updates of the same
+        sales person wait for each other instead of inserting the same unique rows twice.
+        Return the number of created rows.
+        """
+        if keys is not None:
+            by_person = {}
+            for sales_person, date in keys:
+                if sales_person is not None and date is not None:
+                    by_person.setdefault(sales_person, set()).add(date)
+            if not by_person:
+                return 0
+            rollup_q, deal_q, status_q = Q(pk__in=[]), Q(pk__in=[]), Q(pk__in=[])
+            for sales_person, dates in by_person.items():
+                rollup_q |= Q(sales_person=sales_person, date__in=dates)
+                deal_q |= Q(sales_person=sales_person, current_status_date__in=dates)
+                status_q |= Q(deal__sales_person=sales_person, deal_data__in=dates)
+        else:
+            rollup_q, deal_q, status_q = Q(), Q(), Q()
+            if date_from:
+                rollup_q &= Q(date__gte=date_from)
+                deal_q &= Q(current_status_date__gte=date_from)
+                status_q &= Q(deal_data__gte=date_from)
+            if date_to:
+                rollup_q &= Q(date__lte=date_to)
+                deal_q &= Q(current_status_date__lte=date_to)
+                status_q &= Q(deal_data__lte=date_to)
+
+        rows = {}
+
+        def row(date, sales_person, status):
+            key = (date, sales_person, status)
+            if key not in rows:
+                rows[key] = self.model(date=date, sales_person_id=sales_person, status=status)
+            return rows[key]
+
+        with transaction.atomic():
+            persons = SalesPerson.objects.select_for_update().order_by('pk')
+            if keys is not None:
+                persons = persons.filter(pk__in=by_person)
+            list(persons.values_list('pk', flat=True))
+            self.filter(rollup_q).delete()
+
+            # Deals which are on this stage now, by the date of their latest status
+            deals = (Deal.objects.filter(deal_q).exclude(current_status_date__isnull=True).order_by()
+                     .values('current_status_date', 'sales_person', 'current_status')
+                     .annotate(qty=Count('id'), money=Sum('price')))
+            for deal in deals:
+                rollup = row(deal['current_status_date'], deal['sales_person'], deal['current_status'])
+                rollup.deal_count = deal['qty']
+                rollup.total_price = deal['money'] or 0
+
+            # Deals which have entered the stage at this date
+            statuses = (DealStatus.objects.filter(status_q).exclude(deal__isnull=True).order_by()
+                        .values('deal_data', 'deal__sales_person', 'status')
+                        .annotate(qty=Count('deal', distinct=True), money=Sum('deal__price')))
+            for status in statuses:
+                rollup = row(status['deal_data'], status['deal__sales_person'], status['status'])
+                rollup.entered_count = status['qty']
+                rollup.entered_price = status['money'] or 0
+
+            self.bulk_create(rows.values(), batch_size=1000)
+
+        return len(rows)
+
+
+class DailySales(models.Model):
+    """
+    Daily rollup of deals per sales person and stage. It's a cache for the reports, don't edit it manually:
+    it is updated by crm.signals and rebuilt by rebuild_daily_sales command.
+    """
+    date = models.DateField(_('Дата'), db_index=True)
+    sales_person = models.ForeignKey(SalesPerson, on_delete=models.CASCADE, verbose_name=_('Менеджер'))
+    status = models.CharField(max_length=1, choices=DealStatus.STATUS_CHOICES, verbose_name=_('Статус'))
+
+    # deals with this current status, set at this date
+    deal_count = models.PositiveIntegerField(_('Количество сделок'), default=0)
+    total_price = models.DecimalField(_('Цена всего'), max_digits=14, decimal_places=2, default=0)
+    # deals which have entered this status at this date
+    entered_count = models.PositiveIntegerField(_('Перешло на этап'), default=0)
+    entered_price = models.DecimalField(_('Цена перешедших на этап'), max_digits=14, decimal_places=2, default=0)
+
+    objects = DailySalesQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _('Продажи за день')
+        verbose_name_plural = _('Продажи по дням')
+        unique_together = (("date", "sales_person", "status"),)
+
+    def __str__(self):
+        return '%s %s %s' % (self.date, self.sales_person_id, self.status)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Keyset ( cursor ) pagination for django_tables2 list views.
+# Offset pagination of RequestConfig makes COUNT(*) over the whole queryset and reads all skipped rows,
+# it gets slow on the deep pages of big tenants. Keyset mode remembers the sort value and pk of the last shown
+# row and asks only for the rows after it, so every page costs the same and no total count is needed.
+
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django_tables2 import RequestConfig
+
+from crm.tables import project_queryset
+from simpleCRM import settings
+
+# Upper limit of ?per_page= of the keyset pages
+MAX_PER_PAGE = 100
+
+
+def encode_cursor(sort, value, pk):
+    """
+    >>> decode_cursor(encode_cursor('-deal_data', '2017-01-01', 5))
+    ['-deal_data', '2017-01-01', 5]
+    """
+    data = json.dumps([sort, value, pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        sort, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        return [sort, value, int(pk)]
+    except (ValueError, TypeError, UnicodeError):
+        return None
+
+
+def is_keyset(request):
+    mode = request.GET.get('paging') or getattr(settings, 'TABLE_PAGINATION', 'offset')
+    return mode == 'keyset'
+
+
+def get_per_page(request, default):
+    """
+    Rows per page from ?per_page=, the default for a bad value, never more than MAX_PER_PAGE.
+
+    >>> from django.test import RequestFactory
+    >>> [get_per_page(RequestFactory().get('/', {'per_page': value}), 25) for value in ('10', 'x', '-1', '100000')]
+    [10, 25, 25, 100]
+    """
+    try:
+        per_page = int(request.GET.get('per_page') or default)
+    except ValueError:
+        per_page = default
+    if per_page < 1:
+        per_page = default
+    return min(per_page, MAX_PER_PAGE)
+
+
+def sort_field(table, sort, default_sort):
+    # Return (queryset field, descending) for the sort alias from request, only orderable columns are allowed
+    alias = sort.lstrip('-')
+    if alias not in [column.name for column in table.columns if column.orderable]:
+        sort = default_sort
+        alias = sort.lstrip('-')
+    field = str(table.columns[alias].accessor).replace('.', '__') if alias in table.columns else alias
+    return sort, field, sort.startswith('-')
+
+
+def row_value(row, field):
+    # Value of the sort field which can be sent in the URL ( FK is sent as its id )
+    model = type(row)
+    try:
+        field = model._meta.get_field(field).attname
+    except FieldDoesNotExist:
+        pass
+    value = getattr(row, field, None)
+    return None if value is None else str(value)
+
+
+def after_cursor(field, value, pk, descending):
+    """
+    Rows after (value, pk) in ORDER BY field, pk. PostgreSQL puts NULL last in ASC order and first in DESC one.
+    """
+    if not descending:
+        if value is None:
+            return Q(**{field + '__isnull': True, 'pk__gt': pk})
+        return (Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk}) |
+                Q(**{field + '__isnull': True}))
+    if value is None:
+        return Q(**{field + '__isnull': True, 'pk__lt': pk}) | Q(**{field + '__isnull': False})
+    return Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+
+
+def keyset_page(request, table, queryset, default_sort):
+    """
+    Rows of the current keyset page ( as queryset ) and links data for the template.
+    Cursors of other sort order are ignored, so the column sort links of the table restart from the first page.
+    """
+    per_page = get_per_page(request, table._meta.per_page or 25)
+    sort, field, descending = sort_field(table, request.GET.get('sort', ''), default_sort)
+    sign = '-' if descending else ''
+
+    after = decode_cursor(request.GET.get('after', ''))
+    before = decode_cursor(request.GET.get('before', ''))
+    after = after if after and after[0] == sort else None
+    before = before if before and before[0] == sort else None
+
+    if before:
+        # Go back: rows before the cursor are the rows after it in the reversed order, then turn them over
+        back = '' if descending else '-'
+        rows = queryset.filter(after_cursor(field, before[1], before[2], not descending))
+        rows = list(rows.order_by(back + field, back + 'pk')[:per_page + 1])
+        has_prev = len(rows) > per_page
+        rows = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if after:
+            queryset = queryset.filter(after_cursor(field, after[1], after[2], descending))
+        rows = list(queryset.order_by(sign + field, sign + 'pk')[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_prev = after is not None
+
+    paging = {'first': page_url(request, sort)}
+    if rows and has_prev:
+        paging['prev'] = page_url(request, sort, before=encode_cursor(sort, row_value(rows[0], field), rows[0].pk))
+    if rows and has_next:
+        paging['next'] = page_url(request, sort, after=encode_cursor(sort, row_value(rows[-1], field), rows[-1].pk))
+    return [row.pk for row in rows], paging
+
+
+def page_url(request, sort, **cursor):
+    # Query string of the page with the same filters and sort order and only one cursor
+    params = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        params.pop(name, None)
+    params['paging'] = 'keyset'
+    params['sort'] = sort
+    params.update(cursor)
+    return '?' + params.urlencode()
+
+
+def configure_table(request, table_class, queryset, default_sort='id'):
+    """
+    Build the table and paginate it. In the offset mode ( default ) it is the common RequestConfig,
+    in the keyset one ( settings.TABLE_PAGINATION or ?paging=keyset ) only rows of the current page are loaded
+    and there is no COUNT(*). Only the fields of the visible columns are read ( see project_queryset ).
+    Return (table, paging), paging is None for the offset mode.
+    """
+    queryset = project_queryset(table_class(queryset), queryset)
+    table = table_class(queryset)
+    if not is_keyset(request):
+        RequestConfig(request).configure(table)
+        return table, None
+
+    pks, paging = keyset_page(request, table, queryset, default_sort)
+    # The page is a small queryset, so the sortable columns still work on the database side.
+    # Without ?sort= RequestConfig does not order it, so the rows get the order of the page
+    sort, field, descending = sort_field(table, request.GET.get('sort', ''), default_sort)
+    sign = '-' if descending else ''
+    table = table_class(queryset.filter(pk__in=pks).order_by(sign + field, sign + 'pk'))
+    RequestConfig(request, paginate=False).configure(table)
+    return table, paging
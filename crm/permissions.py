@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Permission checks with one guardian ObjectPermissionChecker per request.
+# The checker keeps the object permissions it has read, and prefetch_perms() reads them for a whole page
+# of rows by two queries, so a list can show edit / delete links of every row without a query per row.
+# With settings.ROW_SCOPING users who are not bosses are limited to their own rows by scope_queryset,
+# the rows of the scope are allowed without any guardian rows.
+
+from guardian.core import ObjectPermissionChecker
+
+from simpleCRM import settings
+
+
+def get_checker(request):
+    checker = getattr(request, '_perm_checker', None)
+    if checker is None:
+        checker = request._perm_checker = ObjectPermissionChecker(request.user)
+    return checker
+
+
+def is_scoped(request):
+    return getattr(settings, 'ROW_SCOPING', False) and not request.user.is_superuser and \
+        not request.crm_user.is_boss
+
+
+def scope_queryset(request, queryset):
+    '''
+    The only place of the row scoping: deals, customers, todos ( and daily sales ) of the user himself.
+    All crm views take their querysets through it.
+    '''
+    if is_scoped(request):
+        queryset = queryset.filter(sales_person__user=request.user)
+    return queryset
+
+
+def in_scope(request, obj):
+    # Only models with sales_person are scoped, and the own SalesPerson of the user.
+    # The loaded row is checked by its sales_person_id, an unsaved Model(pk=pk) by a query
+    if obj._meta.model_name == 'salesperson':
+        return request.crm_user.sales_person_id is not None and str(obj.pk) == str(request.crm_user.sales_person_id)
+    if 'sales_person' not in [field.name for field in obj._meta.get_fields()]:
+        return False
+    if obj.sales_person_id is not None:
+        return obj.sales_person_id == request.crm_user.sales_person_id
+    return scope_queryset(request, type(obj)._default_manager.filter(pk=obj.pk)).exists()
+
+
+def has_perm(request, perm, obj=None):
+    '''
+    Model ( global or by group ) permission, else the row of the own scope ( settings.ROW_SCOPING ),
+    else the guardian permission for the object.
+    Only obj.pk is needed, so obj may be an unsaved instance like Deal(pk=pk).
+    '''
+    if request.user.has_perm(perm):
+        return True
+    if obj is None:
+        return False
+    if is_scoped(request) and in_scope(request, obj):
+        return True
+    return get_checker(request).has_perm(perm, obj)
+
+
+def prefetch_perms(request, objects, perms=()):
+    '''
+    Read the object permissions of the user for all the objects ( of one model ) at once.
+    Nothing is read if the user has all the perms for the model anyway.
+    '''
+    if perms and all(request.user.has_perm(perm) for perm in perms):
+        return
+    objects = list(objects)
+    if objects and request.user.is_authenticated():
+        get_checker(request).prefetch_perms(objects)
+
+
+def page_records(table):
+    # Records of the shown page of the table, both for offset and keyset pagination
+    rows = table.page.object_list if getattr(table, 'page', None) else table.rows
+    return [row.record for row in rows]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Cache of the report results. Every tenant has its own generation, which is a part of all its keys.
+# Any change of deals replaces the generation ( see crm.signals ), so all old entries of the tenant
+# become unreachable and expire by timeout.
+# Every generation is a random value, never a counter. File based cache has no atomic incr, and a culled
+# generation key must not bring back the entries of an old generation.
+# Invalidation is best-effort: an entry computed from rows which are being changed right now
+# may live until REPORT_CACHE_TIMEOUT.
+# Local-memory cache is per process. Use the file based one if the site is served by several processes.
+
+import hashlib
+import uuid
+
+from django.core.cache import caches
+from django.db import connection
+from django.utils import translation
+
+from crm.permissions import is_scoped
+from simpleCRM import settings
+
+# GET parameters which don't change the result of a report
+IGNORED_PARAMS = ('csrfmiddlewaretoken', 'page')
+
+
+def get_cache():
+    return caches[getattr(settings, 'REPORT_CACHE', 'default')]
+
+
+def generation_key(schema):
+    return 'report:gen:%s' % schema
+
+
+def get_generation(schema):
+    cache = get_cache()
+    generation = cache.get(generation_key(schema))
+    if generation is None:
+        # add() doesn't change existing value, so concurrent requests mostly get the same generation
+        generation = uuid.uuid4().hex
+        cache.add(generation_key(schema), generation, None)
+        generation = cache.get(generation_key(schema), generation)
+    return generation
+
+
+def invalidate_reports(schema=None):
+    schema = schema or connection.schema_name
+    get_cache().set(generation_key(schema), uuid.uuid4().hex, None)
+
+
+def normalize_params(params):
+    """
+    Make the same string from GET parameters whatever their order and empty values are.
+
+    >>> normalize_params({'sales_person': ['2'], 'deal_data_0': [''], 'csrfmiddlewaretoken': ['x'], 'a': ['2', '1']})
+    'a=1&a=2&sales_person=2'
+    """
+    items = []
+    for name in sorted(params):
+        if name in IGNORED_PARAMS:
+            continue
+        values = params[name]
+        for value in sorted(values if isinstance(values, (list, tuple)) else [values]):
+            if value != '':
+                items.append('%s=%s' % (name, value))
+    return '&'.join(items)
+
+
+def report_key(report, params, schema=None):
+    schema = schema or connection.schema_name
+    normalized = normalize_params(params)
+    digest = hashlib.md5(normalized.encode('utf-8')).hexdigest()
+    # Labels inside the reports are translated, so the language is a part of the key
+    return 'report:%s:%s:%s:%s:%s' % (schema, get_generation(schema), report, translation.get_language(), digest)
+
+
+def cached_report(report, request, compute):
+    """
+    Return result of compute() for the report with filters from request.GET, calling it only on cache miss.
+    compute() must return picklable data.
+    """
+    params = dict(request.GET.lists())
+    if is_scoped(request):
+        # the report is built from the rows of the user only ( settings.ROW_SCOPING )
+        params['scope'] = [str(request.user.pk)]
+    key = report_key(report, params)
+    cache = get_cache()
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, getattr(settings, 'REPORT_CACHE_TIMEOUT', 60 * 15))
+    return result
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Aggregations for the report pages. Every function here makes a fixed number of queries
+# whatever number of deals a tenant has.
+
+import datetime
+import math
+import time
+
+from django.db import connection
+from django.db.models import Sum, Count
+
+from crm.models import DealStatus, DailySales
+
+GRANULARITY = ('day', 'week', 'month')
+
+
+def trunc_date(date, granularity):
+    # Python twin of the PostgreSQL date_trunc() for the supported granularities
+    if granularity == 'week':
+        return date - datetime.timedelta(days=date.weekday())
+    if granularity == 'month':
+        return date.replace(day=1)
+    return date
+
+
+def shift_date(date, granularity, n):
+    # Move a truncated date by n periods
+    if granularity == 'week':
+        return date + datetime.timedelta(weeks=n)
+    if granularity == 'month':
+        month = date.month - 1 + n
+        return date.replace(year=date.year + month // 12, month=month % 12 + 1)
+    return date + datetime.timedelta(days=n)
+
+
+def date_buckets(date_min, date_max, buckets=20, granularity=None):
+    """
+    Return the first dates of the buckets covering [date_min, date_max].
+
+    Without granularity the interval is split on `buckets` equal parts ( the step is rounded up to whole days ).
+    With granularity ( day, week or month ) the last `buckets` calendar periods up to date_max are used.
+
+    >>> date_buckets(datetime.date(2017, 1, 1), datetime.date(2017, 1, 31), buckets=3)
+    [datetime.date(2017, 1, 1), datetime.date(2017, 1, 11), datetime.date(2017, 1, 21)]
+    >>> date_buckets(datetime.date(2016, 1, 1), datetime.date(2017, 2, 15), buckets=3, granularity='month')
+    [datetime.date(2016, 12, 1), datetime.date(2017, 1, 1), datetime.date(2017, 2, 1)]
+    """
+    if granularity in GRANULARITY:
+        last = trunc_date(date_max, granularity)
+        return [shift_date(last, granularity, n) for n in range(1 - buckets, 1)]
+
+    step = max(math.ceil((date_max - date_min).days / buckets), 1)
+    return [date_min + datetime.timedelta(days=step * n) for n in range(buckets)]
+
+
+def sales_time_series(queryset, date_min, date_max, buckets=20, granularity=None,
+                      date_column='current_status_date', total=None, qty=None):
+    """
+    Sum of deals price and number of deals for every date bucket in one grouped query.
+
+    queryset - deals to aggregate ( already filtered ), date_column - column of the queryset table with the date.
+    total and qty are aggregates for the price and the number of deals, Sum('price') and Count('id') by default
+    ( DailySales rollup is aggregated with Sum('total_price') and Sum('deal_count') ).
+    Return (xdata, ydata, ydata_qty) ready for nvd3 lineChart: xdata is bucket start in milliseconds.
+    """
+    starts = date_buckets(date_min, date_max, buckets, granularity)
+    column = '"%s"."%s"' % (queryset.model._meta.db_table, date_column)
+
+    if granularity in GRANULARITY:
+        bucket_sql = "date_trunc('%s', %s)::date" % (granularity, column)
+        params = []
+    else:
+        step = (starts[1] - starts[0]).days if len(starts) > 1 else 1
+        # date - date is a number of days in PostgreSQL, the last bucket is closed from the right
+        bucket_sql = 'LEAST((%s - %%s) / %%s, %%s)' % column
+        params = [starts[0], step, len(starts) - 1]
+
+    queryset = queryset.filter(**{date_column + '__gte': starts[0], date_column + '__lte': date_max})
+    rows = (queryset.order_by()
+            .extra(select={'bucket': bucket_sql}, select_params=params)
+            .values('bucket')
+            .annotate(total_price=total or Sum('price'), qty=qty or Count('id')))
+
+    totals = {}
+    for row in rows:
+        key = row['bucket'] if granularity in GRANULARITY else starts[row['bucket']]
+        totals[key] = row
+
+    xdata, ydata, ydata_qty = [], [], []
+    for start in starts:
+        row = totals.get(start, {})
+        xdata.append(int(time.mktime(start.timetuple()) * 1000))
+        ydata.append(int(row.get('total_price') or 0))
+        ydata_qty.append(row.get('qty') or 0)
+
+    return xdata, ydata, ydata_qty
+
+
+def sales_funnel(queryset, choices, ever_reached=False):
+    """
+    Number of deals and sum of their price for every stage of the funnel in one grouped query.
+
+    queryset - deals to aggregate ( already filtered ), choices - stages as (code, label) in funnel order.
+    By default every deal is counted once, at its current stage. With ever_reached a deal is counted at every
+    stage it has ever had in its history, then conversions between neighbour stages are meaningful.
+    Return (records, records_many, conversions): [[label, qty], ...], [[label, money], ...]
+    and [[label, percent of the previous stage], ...].
+    """
+    if ever_reached:
+        deals_sql, params = queryset.order_by().values('id', 'price').query.sql_with_params()
+        sql = ('SELECT s.status, COUNT(*), SUM(d.price) FROM ({deals}) d '
+               'JOIN (SELECT DISTINCT deal_id, status FROM {status}) s ON s.deal_id = d.id '
+               'GROUP BY s.status').format(deals=deals_sql, status=DealStatus._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = {status: (qty, money) for status, qty, money in cursor.fetchall()}
+    else:
+        rows = queryset.order_by().values('current_status').annotate(qty=Count('id'), money=Sum('price'))
+        rows = {row['current_status']: (row['qty'], row['money']) for row in rows}
+
+    return funnel_records(rows, choices)
+
+
+def sales_funnel_rollup(queryset, choices, ever_reached=False):
+    """
+    The same as sales_funnel, but from DailySales rollup rows ( already filtered ).
+    With ever_reached the deal is counted once for every day it has entered the stage.
+    """
+    if ever_reached:
+        rows = queryset.order_by().values('status').annotate(qty=Sum('entered_count'), money=Sum('entered_price'))
+    else:
+        rows = queryset.order_by().values('status').annotate(qty=Sum('deal_count'), money=Sum('total_price'))
+    rows = {row['status']: (row['qty'], row['money']) for row in rows}
+    return funnel_records(rows, choices)
+
+
+def funnel_records(rows, choices):
+    # rows is {status: (qty, money)}
+    records, records_many, conversions = [], [], []
+    previous = None
+    for code, label in choices:
+        qty, money = rows.get(code, (0, None))
+        qty = qty or 0
+        records.append([label, qty])
+        records_many.append([label, float(money or 0)])
+        if previous is not None:
+            conversions.append([label, round(100.0 * qty / previous, 1) if previous else 0])
+        previous = qty
+
+    return records, records_many, conversions
+
+
+def rollup_queryset(cleaned_data):
+    """
+    DailySales rows matching the cleaned data of DealFilter or ReportFilter
+    ( sales_person, deal_data range and optional status ).
+    """
+    queryset = DailySales.objects.all()
+    if cleaned_data.get('sales_person'):
+        queryset = queryset.filter(sales_person=cleaned_data['sales_person'])
+    period = cleaned_data.get('deal_data')
+    if period:
+        if period.start:
+            queryset = queryset.filter(date__gte=period.start)
+        if period.stop:
+            queryset = queryset.filter(date__lte=period.stop)
+    if cleaned_data.get('status') not in (None, '', 'Z'):
+        queryset = queryset.filter(status=cleaned_data['status'])
+    return queryset
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Dump of tenant schemas to JSON Lines files ( one file per model, optionally gzipped ).
+# Every line is one object in the format of Django "python" serializer: {"model": ..., "pk": ..., "fields": {...}},
+# so the files can be loaded back by serializers.deserialize('python', ...).
+# Schemas are dumped in parallel by a pool of processes, models are read in pk ordered chunks.
+# Restore loads the files back by bulk_create chunks in one transaction per schema with deferred constraints.
+
+import gzip
+import io
+import json
+import os
+import time
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from tenant_schemas.utils import schema_context, schema_exists
+
+from crm.export import chunked
+from crm.report_cache import invalidate_reports
+from simpleCRM import settings
+
+
+def tenant_models():
+    '''
+    Models which have tables in every tenant schema ( apps of TENANT_APPS ), without proxy and unmanaged ones.
+    '''
+    result = []
+    for config in apps.get_app_configs():
+        if config.name not in settings.TENANT_APPS:
+            continue
+        for model in config.get_models():
+            if model._meta.proxy or not model._meta.managed:
+                continue
+            result.append(model)
+    return result
+
+
+def dump_path(directory, schema, model, compress=False):
+    '''
+    >>> from crm.models import Deal
+    >>> dump_path('/tmp', 'a1', Deal, compress=True)
+    '/tmp/a1/crm.deal.jsonl.gz'
+    '''
+    name = '%s.%s.jsonl' % (model._meta.app_label, model._meta.model_name)
+    return os.path.join(directory, schema, name + ('.gz' if compress else ''))
+
+
+def open_dump(path, mode='r'):
+    # Text file of the dump, gzipped if the name ends with .gz
+    if path.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, mode + 'b'), encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+
+def dump_model(model, path, chunk_size=None):
+    '''
+    Write all rows of the model ( in the current schema ) to the file, return the number of rows.
+    '''
+    count = 0
+    with open_dump(path, 'w') as out:
+        for obj in chunked(model._default_manager.all(), chunk_size):
+            data = serializers.serialize('python', [obj])[0]
+            out.write(json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False))
+            out.write('\n')
+            count += 1
+    return count
+
+
+def dump_schema(schema, directory, compress=False, chunk_size=None):
+    '''
+    Dump every tenant model of the schema. Return (schema, {model label: rows}, seconds).
+    It is run in a worker process of the pool, so it takes and returns only plain data.
+    '''
+    start = time.time()
+    os.makedirs(os.path.join(directory, schema), exist_ok=True)
+    counts = {}
+    with schema_context(schema):
+        for model in tenant_models():
+            counts[model._meta.label] = dump_model(model, dump_path(directory, schema, model, compress), chunk_size)
+    return schema, counts, time.time() - start
+
+
+def dump_schema_worker(args):
+    # Pool.imap_unordered passes one argument
+    return dump_schema(*args)
+
+
+def model_of_path(path):
+    '''
+    >>> model_of_path('/tmp/a1/crm.deal.jsonl.gz')._meta.label
+    'crm.Deal'
+    '''
+    name = os.path.basename(path)
+    app_label, model_name = name.split('.')[:2]
+    return apps.get_model(app_label, model_name)
+
+
+def dump_files(directory, schema):
+    # Dump files of the schema in the directory, sorted for the stable order of loading
+    folder = os.path.join(directory, schema)
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.endswith('.jsonl') or name.endswith('.jsonl.gz')]
+
+
+def save_chunk(model, objects):
+    # bulk_create the objects, then the rows of their many-to-many relations ( bulk_create does not save them )
+    model._default_manager.bulk_create([obj.object for obj in objects])
+    for obj in objects:
+        for name, values in obj.m2m_data.items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            through._default_manager.bulk_create(
+                through(**{source: obj.object.pk, target: value}) for value in values)
+
+
+def load_model(model, path, chunk_size=None):
+    '''
+    Insert the rows of the dump file into the model table ( of the current schema ), return the number of rows.
+    '''
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    count = 0
+    with open_dump(path) as lines:
+        chunk = []
+        for line in lines:
+            if not line.strip():
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                save_chunk(model, list(serializers.deserialize('python', chunk, ignorenonexistent=True)))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            save_chunk(model, list(serializers.deserialize('python', chunk, ignorenonexistent=True)))
+            count += len(chunk)
+    return count
+
+
+def restore_schema(schema, directory, chunk_size=None):
+    '''
+    Replace the data of the existing schema by the dump. All the tenant tables are truncated and loaded in
+    one transaction, foreign keys are checked at commit ( so the order of models does not matter ),
+    the sequences are set after the loaded ids. Return (schema, {model label: rows}, seconds, error).
+    '''
+    start = time.time()
+    counts = {}
+    if not schema_exists(schema):
+        return schema, counts, time.time() - start, 'schema does not exist, create the tenant first'
+    try:
+        with schema_context(schema), transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+            tables = [model._meta.db_table for model in tenant_models()]
+            cursor.execute('TRUNCATE %s CASCADE' % ', '.join(connection.ops.quote_name(t) for t in tables))
+
+            loaded = []
+            for path in dump_files(directory, schema):
+                model = model_of_path(path)
+                counts[model._meta.label] = load_model(model, path, chunk_size)
+                loaded.append(model)
+
+            for sql in connection.ops.sequence_reset_sql(no_style(), loaded):
+                cursor.execute(sql)
+        # cached reports of the schema are built from the old data
+        invalidate_reports(schema)
+    except Exception as error:
+        return schema, counts, time.time() - start, str(error)
+    return schema, counts, time.time() - start, None
+
+
+def restore_schema_worker(args):
+    # Pool.imap_unordered passes one argument
+    return restore_schema(*args)
+
+
+def close_connections():
+    # Forked processes must not share the database connection of the parent, every process opens its own one
+    connections.close_all()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Full-text search over customers, deals and todos by the search_vector columns ( see migration 0006 ).
+# The 'simple' configuration is used: tenants write in different languages, so words are not stemmed,
+# every word of the query is matched as a prefix ( search as you type ).
+
+import re
+
+CONFIG = 'simple'
+
+# Characters with special meaning in tsquery
+WORD = re.compile(r"[^\s&|!():*'\\<>]+")
+
+
+def prefix_query(term):
+    """
+    tsquery text which matches every word of the term as a prefix, None if there are no words.
+
+    >>> prefix_query("Ivan  c1@example.com (123)")
+    'Ivan:* & c1@example.com:* & 123:*'
+    >>> prefix_query("a' | !b")
+    'a:* & b:*'
+    >>> prefix_query(' & ') is None
+    True
+    """
+    words = WORD.findall(term)
+    if not words:
+        return None
+    return ' & '.join(word + ':*' for word in words)
+
+
+def search_queryset(queryset, term):
+    '''
+    Rows of the queryset ( Customer, Deal or Todo ) matching the term, ordered by ts_rank ( extra field rank ).
+    The @@ condition uses the GIN index of search_vector.
+    '''
+    query = prefix_query(term)
+    if query is None:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    return queryset.extra(
+        select={'rank': 'ts_rank(%s.search_vector, to_tsquery(%%s, %%s))' % table},
+        select_params=(CONFIG, query),
+        where=['%s.search_vector @@ to_tsquery(%%s, %%s)' % table],
+        params=[CONFIG, query],
+        order_by=['-rank'])
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-#
+
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from crm.models import Deal, DealProducts, DealStatus, DailySales, SalesPerson
+from crm.report_cache import invalidate_reports
+from crm.user_context import invalidate_user_context
+
+__author__ = 'AMA'
+
+
+# Keep Deal.current_status* in sync with the status history ( formsets, admin, shell - everything goes here )
+@receiver(post_save, sender=DealStatus)
+@receiver(post_delete, sender=DealStatus)
+def update_deal_current_status(sender, instance, **kwargs):
+    if instance.deal_id is None:
+        return
+    # Deal may be already deleted when its statuses are removed by cascade
+    Deal(pk=instance.deal_id).refresh_current_status()
+
+
+# ------------------------- Daily sales rollup ---------------------------------------------------------------
+
+def rollup_keys(deal_id):
+    # (sales_person, date) rows of DailySales which depend on the deal
+    deal = Deal.objects.filter(pk=deal_id).values('sales_person', 'current_status_date').first()
+    if deal is None:
+        return set()
+    dates = set(DealStatus.objects.filter(deal=deal_id).values_list('deal_data', flat=True))
+    dates.add(deal['current_status_date'])
+    return {(deal['sales_person'], date) for date in dates}
+
+
+def status_keys(deal_id, date):
+    # Rows which one status of the deal changes: its own date ( entered_* ) and the current status date ( deal_* )
+    deal = Deal.objects.filter(pk=deal_id).values('sales_person', 'current_status_date').first()
+    if deal is None:
+        return set()
+    return {(deal['sales_person'], date), (deal['sales_person'], deal['current_status_date'])}
+
+
+def deal_id_of(instance):
+    return instance.pk if isinstance(instance, Deal) else instance.deal_id
+
+
+# Remember rows depending on the deal before the change, for example the old sales person or status date
+@receiver(pre_save, sender=Deal)
+@receiver(pre_delete, sender=Deal)
+@receiver(pre_save, sender=DealStatus)
+@receiver(pre_delete, sender=DealStatus)
+def remember_rollup_keys(sender, instance, signal, **kwargs):
+    instance._rollup_keys = set()
+    instance._rollup_changed = True
+    if instance.pk is None:
+        return
+    old = sender.objects.filter(pk=instance.pk).first()
+    if old is None or deal_id_of(old) is None:
+        return
+    if sender is DealStatus:
+        instance._rollup_keys = status_keys(old.deal_id, old.deal_data)
+    elif signal is pre_delete or (old.sales_person_id, old.price) != (instance.sales_person_id, instance.price):
+        # Only the sales person and the price of a deal are summed up in the rollup
+        instance._rollup_keys = rollup_keys(old.pk)
+    else:
+        instance._rollup_changed = False
+
+
+# Must be connected after update_deal_current_status, because it uses Deal.current_status_date
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=DealStatus)
+@receiver(post_delete, sender=DealStatus)
+def update_daily_sales(sender, instance, **kwargs):
+    keys = getattr(instance, '_rollup_keys', set())
+    if isinstance(instance, Deal):
+        if getattr(instance, '_rollup_changed', True):
+            keys |= rollup_keys(instance.pk)
+    elif instance.deal_id is not None:
+        keys |= status_keys(instance.deal_id, instance.deal_data)
+    if keys:
+        DailySales.objects.rebuild(keys=keys)
+
+
+# Any change of deals makes cached reports of this tenant out of date
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=DealProducts)
+@receiver(post_delete, sender=DealProducts)
+@receiver(post_save, sender=DealStatus)
+@receiver(post_delete, sender=DealStatus)
+def invalidate_deal_reports(sender, instance, **kwargs):
+    invalidate_reports()
+
+
+# SalesPerson or groups of a user are changed, so the user context in his sessions is out of date
+@receiver(post_save, sender=SalesPerson)
+@receiver(post_delete, sender=SalesPerson)
+def invalidate_sales_person_context(sender, instance, **kwargs):
+    invalidate_user_context(instance.user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_groups_context(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups was changed
+        if action.startswith('post_'):
+            invalidate_user_context(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set will be cleared, members must be found before it
+        for user_id in instance.user_set.values_list('pk', flat=True):
+            invalidate_user_context(user_id)
+    elif action in ('post_add', 'post_remove'):
+        for user_id in pk_set:
+            invalidate_user_context(user_id)
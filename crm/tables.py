@@ -1,12 +1,44 @@
 # -*- coding: utf-8 -*-#
-from crm.mixin import SomeUtilsMixin
-
 __author__ = 'AMA'
 
 import django_tables2 as tables
-from .models import SalesPerson, Todo, Customer, Deal, Product
+from .models import SalesPerson, Todo, Customer, Deal, Product, DealStatus
+from django.core.exceptions import FieldDoesNotExist
+from django.core.urlresolvers import reverse
+from django.db import models
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext_lazy as _
 from django_tables2.utils import A  # alias for Accessor
+from crm.permissions import has_perm
+
+
+def project_queryset(table, queryset):
+    '''
+    Load only the model fields shown by the visible columns of the table ( and pk ).
+    Shown foreign keys are joined by select_related, without the text and file fields of the related model,
+    so __str__ of SalesPerson or Customer does not make a query per row.
+    Columns which are not model fields ( annotations, properties ) are left as they are.
+    '''
+    model = queryset.model
+    only = [model._meta.pk.name]
+    related = []
+    for column in table.columns:  # visible columns only
+        name = str(column.accessor).split('.')[0]
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if not field.concrete or field.many_to_many:
+            continue
+        only.append(name)
+        if field.is_relation:
+            related.append(name)
+            only.extend(name + '__' + f.name for f in field.related_model._meta.concrete_fields
+                        if not isinstance(f, (models.TextField, models.FileField)))
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*only)
 
 
 class SalesPersonTable(tables.Table):
@@ -15,7 +47,7 @@ class SalesPersonTable(tables.Table):
 
     class Meta:
         model = SalesPerson
-        exclude = ('avatar',)
+        exclude = ('avatar', 'phone_digits', 'mobile_digits')
         attrs = {'class': 'paleblue table table-striped table-bordered'}  # add class="paleblue" to <table> tag
         empty_text = _(
             'Пока нет ни одного менеджера по продажам. Для добавления используйте соответствующий пункт меню')
@@ -36,7 +68,7 @@ class CustomersTable(tables.Table):
 
     class Meta:
         model = Customer
-        exclude = ('avatar', 'comment')
+        exclude = ('avatar', 'comment', 'phone_digits', 'mobile_digits')
         attrs = {'class': 'paleblue table table-striped table-bordered'}
         empty_text = _('Пока нет ни одного клиента. Для добавления используйте соответствующий пункт меню')
 
@@ -48,11 +80,18 @@ class ProductTable(tables.Table):
         attrs = {'class': 'paleblue table table-striped table-bordered'}
         empty_text = _('Пока нет ни одного продукта. Для добавления используйте соответствующий пункт меню')
 
-class DealsTable(tables.Table, SomeUtilsMixin):
+class DealsTable(tables.Table):
+    # One letter status code -> human readable text. Used at render time, so only rows of the shown page are touched
+    STATUS_LABELS = dict(DealStatus.STATUS_CHOICES)
+
     id = tables.LinkColumn('dealpage', args=[A('pk')])
     deal_data = tables.DateTimeColumn(format="d/m/Y", verbose_name=_('Дата'))
     deal_time = tables.DateTimeColumn(format="H.i", verbose_name=_('Время'))
     deal_status = tables.Column( verbose_name=_('Статус'))
+    # Edit / delete links by the rights of the user. The view sets table.request and prefetches the object
+    # permissions of the page rows ( see crm.permissions )
+    actions = tables.Column(empty_values=(), orderable=False, verbose_name='')
+    export_exclude = ('actions',)
 
     def order_deal_data(self, queryset, is_descending):
         if is_descending:
@@ -73,10 +112,27 @@ class DealsTable(tables.Table, SomeUtilsMixin):
             queryset = queryset.order_by('-deal_status')
         else:
             queryset = queryset.order_by('deal_status')
-        queryset=self.doHumanReadble_STATUS_CHOICES(queryset)
         return (queryset, True)
 
+    def render_deal_status(self, value):
+        return self.STATUS_LABELS.get(value, value)
+
+    def render_actions(self, record):
+        request = getattr(self, 'request', None)
+        if request is None:
+            return ''
+        links = []
+        if has_perm(request, 'crm.change_deal', record):
+            links.append(format_html('<a href="{}"><i class="fa fa-pencil"></i></a>',
+                                     reverse('dealpage', args=[record.pk])))
+        if has_perm(request, 'crm.delete_deal', record):
+            links.append(format_html('<a href="{}"><i class="fa fa-trash"></i></a>',
+                                     reverse('deal_del', args=[record.pk])))
+        return mark_safe('&nbsp;&nbsp;'.join(links))
+
     class Meta:
         model = Deal
+        # the newest status is shown by deal_data, deal_time and deal_status columns
+        exclude = ('current_status', 'current_status_date', 'current_status_time')
         attrs = {'class': 'paleblue table table-striped table-bordered'}
         empty_text = _('Пока нет ни одной сделки. Для добавления используйте соответствующий пункт меню')
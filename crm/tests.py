@@ -1,11 +1,43 @@
+import datetime
 import doctest
+import json
+import os
+import tempfile
+import tracemalloc
+from decimal import Decimal
 
-from django.test import TestCase
+from django.contrib.auth.models import User, Permission
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import serializers
+from guardian.shortcuts import assign_perm
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from crm import models as crm_models
+from crm import reports
+from crm import report_cache
+from crm import mixin
+from crm import pagination
+from crm import export
+from crm import customer_import
+from crm import schema_dump
+from crm import permissions
+from crm import search
+from crm.user_context import UserContext, get_user_context, version_key
+from django.core.cache import caches
+from simpleCRM import settings as crm_settings
+from crm.views.product_views import product_search
+from crm.views.views import phone_lookup, search as search_view
+from crm.tables import DealsTable, CustomersTable, project_queryset
 from crm.views import deal_views
+from crm.views import views
+from crm.filters import DealFilter
 from crm.views.deal_views import DealUpdateView
+from crm.views.customer_views import CustomerImportView
+from django.core.files.uploadedfile import SimpleUploadedFile
 from globalcustomer import views as gb_views
 from globalcustomer import models as gb_models
+from globalcustomer import middleware as gb_middleware
 from unittest.mock import patch, MagicMock
 
 '''
@@ -19,12 +51,39 @@ http://stackoverflow.com/questions/2380527/django-doctests-in-views-py
 def load_tests(loader, tests, ignore):
     tests.addTests(doctest.DocTestSuite(deal_views))
     tests.addTests(doctest.DocTestSuite(crm_models))
+    tests.addTests(doctest.DocTestSuite(reports))
+    tests.addTests(doctest.DocTestSuite(report_cache))
+    tests.addTests(doctest.DocTestSuite(mixin))
+    tests.addTests(doctest.DocTestSuite(pagination))
+    tests.addTests(doctest.DocTestSuite(customer_import))
+    tests.addTests(doctest.DocTestSuite(schema_dump))
+    tests.addTests(doctest.DocTestSuite(search))
     tests.addTests(doctest.DocTestSuite(gb_views))
     tests.addTests(doctest.DocTestSuite(gb_models))
+    tests.addTests(doctest.DocTestSuite(gb_middleware))
     return tests
 
 
-class DealUpdateViewTest(TestCase):
+# The shared caches of settings are files in BASE_DIR, the tests use their own local-memory ones
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'reports': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-reports'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CrmTestCase(TestCase):
+    # Base of the tests of crm, they never touch the cache files of the running site
+
+    def create_sales_person(self, username, user=None, **fields):
+        # A manager with his own User, fields override the defaults
+        user = user or User.objects.create_user(username=username, password='djangoone')
+        data = {'first_name': 'A', 'second_name': 'B', 'lang': 'en', 'role': 'M'}
+        data.update(fields)
+        return crm_models.SalesPerson.objects.create(user=user, **data)
+
+
+class DealUpdateViewTest(CrmTestCase):
 
     def test_change_request_status(self):
         request = MagicMock()
@@ -41,8 +100,8 @@ class DealUpdateViewTest(TestCase):
         # make fake object for receive result from Product.objects.get()
         res = MagicMock()
         res.price = 5
-        # fake object Product.objects.get() return fake pr.price ( this 5 )
-        mock_product.objects.get.return_value = res
+        # fake object Product.objects.in_bulk() return fake pr.price ( this 5 ) for product 3
+        mock_product.objects.in_bulk.return_value = {3: res}
 
         request = MagicMock()
         request.POST = {}  # must have
@@ -62,3 +121,597 @@ class DealUpdateViewTest(TestCase):
             request = DealUpdateView.change_request_product(fake_self, request)
             self.assertEqual(request.POST['products-0-deal'], '3')
             self.assertEqual(request.POST['products-0-total_price'], '250')
+            mock_product.objects.in_bulk.assert_called_once_with([3])
+
+    @patch.object(deal_views, 'Product')
+    def test_change_request_product_total_price(self, mock_product):
+        res = MagicMock()
+        res.price = 5
+        mock_product.objects.in_bulk.return_value = {3: res}
+
+        request = MagicMock()
+        request.POST = {}  # must have
+
+        fake_self = MagicMock()
+        fake_self.kwargs = {}
+        fake_self.total_deal_price = Decimal('0.00')
+
+        with patch.dict(request.POST,
+                        {'products-TOTAL_FORMS': '3',
+                         'products-0-product': '3', 'products-0-item_price': '', 'products-0-total_price': '',
+                         'products-0-qty': '2',
+                         'products-1-product': '3', 'products-1-item_price': '7', 'products-1-total_price': '14',
+                         'products-1-qty': '2',
+                         'products-2-product': '', 'products-2-item_price': '', 'products-2-total_price': '',
+                         'products-2-qty': ''}), \
+                patch.dict(fake_self.kwargs, {'pk': '3'}):
+            request = DealUpdateView.change_request_product(fake_self, request)
+            self.assertEqual(request.POST['products-0-total_price'], '10')
+            self.assertEqual(request.POST['products-2-DELETE'], 'on')
+            self.assertEqual(fake_self.total_deal_price, Decimal('24.00'))
+            # one query for the whole formset
+            self.assertEqual(mock_product.objects.in_bulk.call_count, 1)
+
+    @patch.object(deal_views, 'Product')
+    def test_change_request_product_invalid_price(self, mock_product):
+        # the product of the first form is not found
+        mock_product.objects.in_bulk.return_value = {}
+
+        request = MagicMock()
+        request.POST = {}  # must have
+
+        fake_self = MagicMock()
+        fake_self.kwargs = {}
+        fake_self.total_deal_price = Decimal('0.00')
+
+        with patch.dict(request.POST,
+                        {'products-TOTAL_FORMS': '2',
+                         'products-0-product': '3', 'products-0-item_price': '', 'products-0-total_price': '',
+                         'products-0-qty': '2',
+                         'products-1-product': '4', 'products-1-item_price': '7', 'products-1-total_price': 'x',
+                         'products-1-qty': '2'}), \
+                patch.dict(fake_self.kwargs, {'pk': '3'}):
+            request = DealUpdateView.change_request_product(fake_self, request)
+            self.assertEqual(fake_self.invalid_products, [0, 1])
+            self.assertEqual(fake_self.total_deal_price, Decimal('0.00'))
+
+
+    def test_post_invalid_product_price(self):
+        sp = self.create_sales_person('sp_post')
+        deal = crm_models.Deal.objects.create(sales_person=sp, ident=50, description='deal')
+        # the product is not found, so the total price can not be computed
+        data = {'sales_person': sp.pk, 'ident': 50, 'description': 'deal', 'price': '0',
+                'products-TOTAL_FORMS': '1', 'products-INITIAL_FORMS': '0', 'products-0-product': '999999',
+                'products-0-item_price': '', 'products-0-total_price': '', 'products-0-qty': '2',
+                'status-TOTAL_FORMS': '0', 'status-INITIAL_FORMS': '0'}
+        request = RequestFactory().post('/crm/deal/%s/' % deal.pk, data)
+        request.user = User.objects.create_superuser(username='sp_post_admin', email='sp@example.com',
+                                                     password='djangoone')
+        request.crm_user = UserContext(request.user.pk, sp.pk, 'M', 'en', ('boss',))
+        request._messages = CookieStorage(request)
+
+        response = DealUpdateView.as_view()(request, pk=str(deal.pk))
+        self.assertEqual(response.status_code, 200)
+        # the error names the first line of the products
+        self.assertTrue(response.context_data['form'].non_field_errors()[0].endswith(': 1'))
+        # the posted rows are shown again
+        self.assertEqual(response.context_data['formset_products'].data['products-0-qty'], '2')
+
+class DealLatestStatusTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_test')
+
+    def test_with_latest_status(self):
+        deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=1, description='deal')
+        crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=datetime.date(2017, 1, 1),
+                                             deal_time=datetime.time(10, 0))
+        last = crm_models.DealStatus.objects.create(deal=deal, status='S', deal_data=datetime.date(2017, 1, 2),
+                                                    deal_time=datetime.time(9, 0))
+        crm_models.DealStatus.objects.create(deal=deal, status='D', deal_data=datetime.date(2017, 1, 2),
+                                             deal_time=datetime.time(8, 0))
+        # deal without any status must be kept too
+        crm_models.Deal.objects.create(sales_person=self.sp, ident=2, description='empty deal')
+
+        deals = {d.ident: d for d in crm_models.Deal.objects.with_latest_status()}
+        self.assertEqual(len(deals), 2)
+        self.assertEqual(deals[1].deal_status, 'S')
+        self.assertEqual(deals[1].deal_data, last.deal_data)
+        self.assertEqual(deals[1].deal_time, last.deal_time)
+        self.assertIsNone(deals[2].deal_status)
+
+    def test_current_status_follows_history(self):
+        deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=3, description='deal')
+        first = crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=datetime.date(2017, 1, 1),
+                                                     deal_time=datetime.time(10, 0))
+        last = crm_models.DealStatus.objects.create(deal=deal, status='H', deal_data=datetime.date(2017, 2, 1),
+                                                    deal_time=datetime.time(10, 0))
+        deal.refresh_from_db()
+        self.assertEqual(deal.current_status, 'H')
+
+        last.delete()
+        deal.refresh_from_db()
+        self.assertEqual(deal.current_status, 'E')
+        self.assertEqual(deal.current_status_date, datetime.date(2017, 1, 1))
+
+        first.delete()
+        deal.refresh_from_db()
+        self.assertIsNone(deal.current_status)
+
+    def test_sales_time_series_buckets(self):
+        days = (datetime.date(2016, 12, 31), datetime.date(2017, 1, 1), datetime.date(2017, 1, 10),
+                datetime.date(2017, 1, 11), datetime.date(2017, 1, 31), datetime.date(2017, 2, 1))
+        for ident, day in enumerate(days, start=20):
+            deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=ident, description='deal', price=ident)
+            crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=day, deal_time=datetime.time(10, 0))
+        deals = crm_models.Deal.objects.all()
+
+        # buckets [1, 11), [11, 21), [21, 31]: the last day of a bucket is in it, the next day is not,
+        # the last bucket is closed from the right, days out of the range are skipped
+        xdata, ydata, ydata_qty = reports.sales_time_series(deals, datetime.date(2017, 1, 1),
+                                                            datetime.date(2017, 1, 31), buckets=3)
+        self.assertEqual(len(xdata), 3)
+        self.assertEqual(ydata_qty, [2, 1, 1])
+        self.assertEqual(ydata, [21 + 22, 23, 24])
+
+        # calendar months: the month boundary splits Jan 31 and Feb 1
+        xdata, ydata, ydata_qty = reports.sales_time_series(deals, datetime.date(2017, 1, 1),
+                                                            datetime.date(2017, 2, 15), buckets=2,
+                                                            granularity='month')
+        self.assertEqual(ydata_qty, [4, 1])
+
+    @patch.object(views, 'cached_report')
+    @patch.object(views, 'render')
+    def test_report_invalid_form(self, mock_render, mock_cached_report):
+        request = RequestFactory().get('/crm/reportsp/', {'buckets': 'x'})
+        request.user = User.objects.create_superuser(username='sp_report', email='sp@example.com',
+                                                     password='djangoone')
+        request.crm_user = UserContext(request.user.pk, self.sp.pk, 'M', 'en', ('boss',))
+        request._messages = CookieStorage(request)
+        with patch.object(crm_settings, 'REPORTS_FROM_ROLLUP', True):
+            views.reportSalesPerson(request, model=crm_models.Deal, classFilter=DealFilter)
+
+        # the form with errors is shown, the report is not computed
+        self.assertFalse(mock_cached_report.called)
+        context = mock_render.call_args[0][2]
+        self.assertIn('buckets', context['chart_form'].errors)
+
+    def test_sales_funnel(self):
+        for ident, statuses in ((4, 'E'), (5, 'ES'), (6, 'ESO')):
+            deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=ident, description='deal', price=10)
+            for day, status in enumerate(statuses, start=1):
+                crm_models.DealStatus.objects.create(deal=deal, status=status, deal_data=datetime.date(2017, 1, day),
+                                                     deal_time=datetime.time(10, 0))
+        choices = (('E', 'E'), ('S', 'S'), ('O', 'O'))
+        queryset = crm_models.Deal.objects.with_latest_status()
+
+        records, records_many, conversions = reports.sales_funnel(queryset, choices)
+        self.assertEqual(records, [['E', 1], ['S', 1], ['O', 1]])
+        self.assertEqual(records_many, [['E', 10.0], ['S', 10.0], ['O', 10.0]])
+
+        records, records_many, conversions = reports.sales_funnel(queryset, choices, ever_reached=True)
+        self.assertEqual(records, [['E', 3], ['S', 2], ['O', 1]])
+        self.assertEqual(conversions, [['S', 66.7], ['O', 50.0]])
+
+    def test_daily_sales_rollup(self):
+        deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=7, description='deal', price=10)
+        first = crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=datetime.date(2017, 1, 1),
+                                                     deal_time=datetime.time(10, 0))
+        crm_models.DealStatus.objects.create(deal=deal, status='S', deal_data=datetime.date(2017, 1, 5),
+                                             deal_time=datetime.time(10, 0))
+        rollup = crm_models.DailySales.objects.get(date=datetime.date(2017, 1, 5), sales_person=self.sp, status='S')
+        self.assertEqual((rollup.deal_count, rollup.entered_count), (1, 1))
+        rollup = crm_models.DailySales.objects.get(date=datetime.date(2017, 1, 1), sales_person=self.sp, status='E')
+        self.assertEqual((rollup.deal_count, rollup.entered_count), (0, 1))
+
+        # moved status must leave nothing at the old date
+        first.deal_data = datetime.date(2017, 1, 2)
+        first.save()
+        self.assertFalse(crm_models.DailySales.objects.filter(date=datetime.date(2017, 1, 1)).exists())
+
+        # the price is summed up, the description is not and doesn't touch the rollup
+        deal.price = 20
+        deal.save()
+        rollup = crm_models.DailySales.objects.get(date=datetime.date(2017, 1, 5), sales_person=self.sp, status='S')
+        self.assertEqual(rollup.total_price, 20)
+        deal.description = 'new deal'
+        with CaptureQueriesContext(connection) as queries:
+            deal.save()
+        self.assertFalse([query for query in queries if 'crm_dailysales' in query['sql']])
+
+        # incremental updates give the same result as the full rebuild
+        incremental = set(crm_models.DailySales.objects.values_list('date', 'status', 'deal_count', 'entered_count'))
+        crm_models.DailySales.objects.rebuild()
+        rebuilt = set(crm_models.DailySales.objects.values_list('date', 'status', 'deal_count', 'entered_count'))
+        self.assertEqual(incremental, rebuilt)
+
+        deal.delete()
+        self.assertFalse(crm_models.DailySales.objects.exists())
+
+
+
+class ReportCacheTest(CrmTestCase):
+
+    def test_deal_changes_invalidate_reports(self):
+        sp = self.create_sales_person('sp_cache')
+        deal = crm_models.Deal.objects.create(sales_person=sp, ident=60, description='deal', price=10)
+        request = RequestFactory().get('/crm/reportsp/', {'sales_person': sp.pk})
+        request.user = sp.user
+        request.crm_user = UserContext(sp.user_id, sp.pk, 'M', 'en', ('manager',))
+        compute = MagicMock(return_value=[1, 2])
+
+        self.assertEqual(report_cache.cached_report('sp', request, compute), [1, 2])
+        report_cache.cached_report('sp', request, compute)
+        self.assertEqual(compute.call_count, 1)
+
+        crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=datetime.date(2017, 1, 1),
+                                             deal_time=datetime.time(10, 0))
+        report_cache.cached_report('sp', request, compute)
+        self.assertEqual(compute.call_count, 2)
+
+        # a culled generation never brings back the entries of an old one
+        report_cache.get_cache().delete(report_cache.generation_key(connection.schema_name))
+        report_cache.cached_report('sp', request, compute)
+        self.assertEqual(compute.call_count, 3)
+
+class UserContextTest(CrmTestCase):
+
+    def test_invalidate_user_context(self):
+        request = RequestFactory().get('/')
+        request.user = User.objects.create_user(username='sp_context', password='djangoone')
+        request.session = {}
+        self.assertFalse(get_user_context(request).is_boss)
+
+        request.user.groups.create(name='boss')
+        # the version is shared by all processes, so no worker keeps the old role
+        self.assertIsNotNone(caches[crm_settings.USER_CONTEXT_CACHE].get(version_key(request.user.pk)))
+        self.assertTrue(get_user_context(request).is_boss)
+
+
+class KeysetPaginationTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_keyset')
+
+    def test_keyset_pagination(self):
+        for ident, day in ((8, 1), (9, 1), (10, 2), (11, 3), (12, None)):
+            deal = crm_models.Deal.objects.create(sales_person=self.sp, ident=ident, description='deal')
+            if day:
+                crm_models.DealStatus.objects.create(deal=deal, status='E', deal_data=datetime.date(2017, 1, day),
+                                                     deal_time=datetime.time(10, 0))
+        queryset = crm_models.Deal.objects.with_latest_status()
+        expected = list(queryset.order_by('-deal_data', '-pk').values_list('pk', flat=True))
+
+        # walk forward over all pages, then back from the last one
+        seen, pages, url = [], [], '?paging=keyset&per_page=2'
+        while url:
+            pks, paging = pagination.keyset_page(RequestFactory().get(url), DealsTable(queryset), queryset,
+                                                 '-deal_data')
+            pages.append(paging)
+            seen.extend(pks)
+            url = paging.get('next')
+        self.assertEqual(seen, expected)
+
+        pks, paging = pagination.keyset_page(RequestFactory().get(pages[-1]['prev']), DealsTable(queryset), queryset,
+                                             '-deal_data')
+        self.assertEqual(pks, expected[2:4])
+
+    def test_configure_table_order(self):
+        for ident in (3, 1, 2):
+            crm_models.Customer.objects.create(sales_person=self.sp, first_name='C%s' % ident, second_name='D',
+                                               status='V')
+        request = RequestFactory().get('/', {'paging': 'keyset', 'per_page': 'x'})
+        table, paging = pagination.configure_table(request, CustomersTable, crm_models.Customer.objects.all(),
+                                                   'first_name')
+        # the first page without ?sort= has the default order too
+        self.assertEqual([row.record.first_name for row in table.rows], ['C1', 'C2', 'C3'])
+
+
+class TableProjectionTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_projection')
+        for n in range(3):
+            crm_models.Customer.objects.create(sales_person=self.sp, first_name='C%s' % n, second_name='D',
+                                               status='N', comment='long text')
+
+    def test_project_queryset(self):
+        queryset = crm_models.Customer.objects.all()
+        queryset = project_queryset(CustomersTable(queryset), queryset)
+        with self.assertNumQueries(1):
+            customers = list(queryset)
+            names = [str(customer.sales_person) for customer in customers]
+        self.assertEqual(names, ['A B'] * 3)
+        self.assertIn('comment', customers[0].get_deferred_fields())
+        self.assertIn('avatar', customers[0].get_deferred_fields())
+
+
+class ExportTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_export')
+
+    def create_customers(self, count):
+        crm_models.Customer.objects.bulk_create(
+            crm_models.Customer(sales_person=self.sp, first_name='C%s' % n, second_name='D', status='V',
+                                comment='x' * 1000)
+            for n in range(count))
+
+    def peak_memory(self, queryset):
+        tracemalloc.start()
+        lines = 0
+        for line in export.csv_rows(CustomersTable(queryset), queryset, chunk_size=500):
+            lines += 1
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return lines, peak
+
+    def test_csv_rows(self):
+        self.create_customers(3)
+        lines = list(export.csv_rows(CustomersTable(crm_models.Customer.objects.all()),
+                                     crm_models.Customer.objects.all(), chunk_size=2))
+        self.assertEqual(len(lines), 4)
+        self.assertIn('C2', lines[-1])
+        self.assertIn('VIP', lines[-1])  # choices are exported by labels
+
+    def test_memory_is_flat(self):
+        self.create_customers(1000)
+        lines, small = self.peak_memory(crm_models.Customer.objects.all())
+        self.assertEqual(lines, 1001)
+
+        self.create_customers(20000)
+        lines, large = self.peak_memory(crm_models.Customer.objects.all())
+        self.assertEqual(lines, 21001)
+        # 21 times more rows must not need much more memory
+        self.assertLess(large, small * 2)
+
+
+class CustomerImportTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_import')
+
+    def test_import_customers(self):
+        lines = ['first_name,second_name,phone_number,email_address,brith_data,status,sales_person',
+                 'C1,D,(123) 456 7899,c1@example.com,1980-01-02,V,',
+                 'C2,D,12,c2@example.com,,V,',  # bad phone
+                 'C3,D,,not e-mail,,V,',  # bad e-mail
+                 'C4,D,,,,X,',  # unknown status
+                 'C5,D,,,,C,999999',  # unknown sales person
+                 'C6,D,,,,C,%s' % self.sp.pk]
+        lines += ['N%s,D,,,,C,' % n for n in range(5)]
+        created, errors = customer_import.import_customers(lines, self.sp.pk, batch_size=2)
+
+        self.assertEqual(created, 7)
+        self.assertEqual([line for line, messages in errors], [3, 4, 5, 6])
+        self.assertIn('phone_number', errors[0][1])
+        self.assertIn('email_address', errors[1][1])
+        self.assertIn('status', errors[2][1])
+        self.assertIn('sales_person', errors[3][1])
+        customer = crm_models.Customer.objects.get(first_name='C1')
+        self.assertEqual(customer.brith_data, datetime.date(1980, 1, 2))
+        self.assertEqual(customer.sales_person, self.sp)
+
+    def test_import_owner(self):
+        other = self.create_sales_person('sp_other', first_name='C', second_name='D')
+        lines = ['first_name,second_name,status,sales_person', 'C1,D,V,%s' % other.pk, 'C2,D,V,']
+        created, errors = customer_import.import_customers(lines, other.pk, owner=self.sp.pk)
+        # a scoped manager can not import customers of other sales persons
+        self.assertEqual((created, errors), (2, []))
+        self.assertEqual(crm_models.Customer.objects.filter(sales_person=self.sp).count(), 2)
+
+
+    def test_import_view_refuses_other_encodings(self):
+        content = 'first_name,second_name,status\nИван,Петров,V\n'.encode('cp1251')
+        request = RequestFactory().post('/crm/customers/import/',
+                                        {'file': SimpleUploadedFile('customers.csv', content, 'text/csv')})
+        request.user = User.objects.create_superuser(username='sp_import_admin', email='sp@example.com',
+                                                     password='djangoone')
+        request.crm_user = UserContext(request.user.pk, self.sp.pk, 'M', 'en', ('boss',))
+
+        response = CustomerImportView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('file', response.context_data['form'].errors)
+        self.assertFalse(crm_models.Customer.objects.exists())
+
+class SchemaDumpTest(CrmTestCase):
+
+    def test_dump_model(self):
+        sp = self.create_sales_person('sp_dump')
+        for n in range(5):
+            crm_models.Customer.objects.create(sales_person=sp, first_name='Ф%s' % n, second_name='D', status='V')
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'customers.jsonl.gz')
+            self.assertEqual(schema_dump.dump_model(crm_models.Customer, path, chunk_size=2), 5)
+            with schema_dump.open_dump(path) as lines:
+                data = [json.loads(line) for line in lines]
+
+        self.assertEqual([row['fields']['first_name'] for row in data], ['Ф%s' % n for n in range(5)])
+        customers = [obj.object for obj in serializers.deserialize('python', data)]
+        self.assertEqual(customers[0].sales_person_id, sp.pk)
+
+    def test_load_model(self):
+        sp = self.create_sales_person('sp_load')
+        for n in range(5):
+            crm_models.Customer.objects.create(sales_person=sp, first_name='C%s' % n, second_name='D', status='V')
+        expected = list(crm_models.Customer.objects.order_by('pk').values_list('pk', 'first_name'))
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'crm.customer.jsonl')
+            schema_dump.dump_model(crm_models.Customer, path)
+            crm_models.Customer.objects.all().delete()
+            self.assertEqual(schema_dump.load_model(crm_models.Customer, path, chunk_size=2), 5)
+
+        self.assertEqual(list(crm_models.Customer.objects.order_by('pk').values_list('pk', 'first_name')), expected)
+
+
+class ObjectPermissionTest(CrmTestCase):
+
+    def test_prefetch_perms(self):
+        sp = self.create_sales_person('sp_perms')
+        deals = [crm_models.Deal.objects.create(sales_person=sp, ident=100 + n, description='deal') for n in range(5)]
+        assign_perm('crm.change_deal', sp.user, deals[1])
+
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=sp.user_id)
+        permissions.prefetch_perms(request, deals, ('crm.change_deal',))
+
+        # the model permissions are cached on the user and the object ones in the checker of the request
+        with self.assertNumQueries(0):
+            allowed = [permissions.has_perm(request, 'crm.change_deal', deal) for deal in deals]
+        self.assertEqual(allowed, [False, True, False, False, False])
+
+
+class RowScopingTest(CrmTestCase):
+
+    def setUp(self):
+        self.users = []
+        self.sps = []
+        for n in range(2):
+            sp = self.create_sales_person('sp_scope%s' % n)
+            crm_models.Deal.objects.create(sales_person=sp, ident=200 + n, description='deal')
+            self.users.append(sp.user)
+            self.sps.append(sp)
+
+    def request(self, n, groups=('manager',)):
+        request = RequestFactory().get('/')
+        request.user = self.users[n]
+        request.crm_user = UserContext(self.users[n].pk, self.sps[n].pk, 'M', 'en', groups)
+        return request
+
+    def test_scope_queryset(self):
+        deals = crm_models.Deal.objects.all()
+        with patch.object(crm_settings, 'ROW_SCOPING', True):
+            self.assertEqual([d.sales_person_id for d in permissions.scope_queryset(self.request(0), deals)],
+                             [self.sps[0].pk])
+            self.assertEqual(permissions.scope_queryset(self.request(0, groups=('boss',)), deals).count(), 2)
+
+            own, other = deals.get(sales_person=self.sps[0]), deals.get(sales_person=self.sps[1])
+            self.assertTrue(permissions.has_perm(self.request(0), 'crm.change_deal', crm_models.Deal(pk=own.pk)))
+            self.assertFalse(permissions.has_perm(self.request(0), 'crm.change_deal', other))
+
+            # the own SalesPerson is in the scope, models without sales_person are not scoped at all
+            own_sp = crm_models.SalesPerson(pk=str(self.sps[0].pk))
+            other_sp = crm_models.SalesPerson(pk=self.sps[1].pk)
+            self.assertTrue(permissions.has_perm(self.request(0), 'crm.change_salesperson', own_sp))
+            self.assertFalse(permissions.has_perm(self.request(0), 'crm.change_salesperson', other_sp))
+            self.assertFalse(permissions.has_perm(self.request(0), 'crm.change_product', crm_models.Product(pk=1)))
+
+        with patch.object(crm_settings, 'ROW_SCOPING', False):
+            self.assertEqual(permissions.scope_queryset(self.request(0), deals).count(), 2)
+
+
+class ProductSearchTest(CrmTestCase):
+
+    def setUp(self):
+        crm_models.Product.objects.create(sku=1234, description='Blue widget', price=10)
+        crm_models.Product.objects.create(sku=5612, description='Red gadget', price=20)
+        crm_models.Product.objects.create(sku=7000, description='100% cotton', price=30)
+
+    def test_search(self):
+        search = crm_models.Product.objects.search
+        self.assertEqual([p.sku for p in search('12').order_by('sku')], [1234])
+        self.assertEqual([p.sku for p in search('GADG')], [5612])
+        # LIKE wildcards of the term are plain characters
+        self.assertEqual([p.sku for p in search('0%')], [7000])
+        self.assertEqual(list(search('_')), [])
+
+    def test_product_search_view(self):
+        request = RequestFactory().get('/crm/products/search/', {'term': 'widget'})
+        request.user = User.objects.create_user(username='sp_search', password='djangoone')
+        # the picker lists products only for users who can read them
+        self.assertEqual(product_search(request).status_code, 302)
+
+        request.user = User.objects.create_superuser(username='sp_search_admin', email='sp@example.com',
+                                                     password='djangoone')
+        response = product_search(request)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['results'][0]['text'], '1234 Blue widget')
+        self.assertFalse(data['more'])
+
+
+class FullTextSearchTest(CrmTestCase):
+
+    def setUp(self):
+        self.sp = self.create_sales_person('sp_fts')
+
+    def test_search_queryset(self):
+        crm_models.Customer.objects.create(sales_person=self.sp, first_name='Ivan', second_name='Petrov', status='V',
+                                           company='Horns', email_address='ivan@example.com')
+        crm_models.Customer.objects.create(sales_person=self.sp, first_name='Olga', second_name='Sidorova',
+                                           status='V', comment='friend of Ivan')
+        # bulk inserted rows are indexed by the trigger too
+        crm_models.Customer.objects.bulk_create([crm_models.Customer(sales_person=self.sp, first_name='Petr',
+                                                                     second_name='Ivanov', status='V')])
+        customers = crm_models.Customer.objects.all()
+
+        found = [c.first_name for c in search.search_queryset(customers, 'iva')]
+        # the names weigh more than the comment
+        self.assertEqual(sorted(found[:2]), ['Ivan', 'Petr'])
+        self.assertEqual(found[2], 'Olga')
+        self.assertEqual([c.first_name for c in search.search_queryset(customers, 'ivan@example.com')], ['Ivan'])
+        self.assertEqual(list(search.search_queryset(customers, '&')), [])
+
+        customer = customers.get(first_name='Olga')
+        customer.comment = ''
+        customer.save()
+        self.assertEqual(len(search.search_queryset(customers, 'iva')), 2)
+
+    def test_search_view(self):
+        other = self.create_sales_person('sp_fts_other', first_name='C', second_name='D')
+        own = crm_models.Customer.objects.create(sales_person=self.sp, first_name='Ivan', second_name='Petrov',
+                                                 status='V')
+        crm_models.Customer.objects.create(sales_person=other, first_name='Ivan', second_name='Sidorov', status='V')
+        crm_models.Deal.objects.create(sales_person=self.sp, ident=300, description='Ivan deal')
+        self.sp.user.user_permissions.add(Permission.objects.get(codename='read_customer'))
+
+        request = RequestFactory().get('/crm/search/', {'q': 'ivan'})
+        request.user = User.objects.get(pk=self.sp.user_id)
+        request.crm_user = UserContext(self.sp.user_id, self.sp.pk, 'M', 'en', ('manager',))
+        with patch.object(crm_settings, 'ROW_SCOPING', True):
+            data = json.loads(search_view(request).content.decode('utf-8'))
+
+        # deals need crm.read_deal, customers of other sales persons are out of the scope
+        self.assertEqual(data['deals'], [])
+        self.assertEqual(data['todos'], [])
+        self.assertEqual(len(data['customers']), 1)
+        self.assertEqual(data['customers'][0]['id'], own.pk)
+        self.assertEqual(data['customers'][0]['text'], 'Ivan Petrov')
+        self.assertEqual(data['customers'][0]['url'], '/crm/customers/%s/' % own.pk)
+        self.assertEqual(sorted(data['customers'][0]), ['id', 'rank', 'text', 'url'])
+
+        request = RequestFactory().get('/crm/search/', {'q': ''})
+        request.user = User.objects.get(pk=self.sp.user_id)
+        self.assertEqual(json.loads(search_view(request).content.decode('utf-8')),
+                         {'customers': [], 'deals': [], 'todos': []})
+
+
+class PhoneLookupTest(CrmTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='sp_phone', email='sp@example.com', password='djangoone')
+        self.sp = self.create_sales_person('sp_phone', user=self.user, mobile_number='8 (900) 111-22-33')
+
+    def lookup(self, number):
+        request = RequestFactory().get('/crm/phone/', {'number': number})
+        request.user = self.user
+        return json.loads(phone_lookup(request).content.decode('utf-8'))
+
+    def test_phone_lookup(self):
+        customer = crm_models.Customer.objects.create(sales_person=self.sp, first_name='Ivan', second_name='Petrov',
+                                                      status='V', phone_number='+7 123-456-7899')
+        self.assertEqual(customer.phone_digits, '1234567899')
+
+        data = self.lookup('(123) 456 7899')
+        self.assertEqual((data['type'], data['id'], data['name']), ('customer', customer.id, 'Ivan Petrov'))
+        data = self.lookup('+79001112233')
+        self.assertEqual((data['type'], data['id']), ('salesperson', self.sp.id))
+        self.assertIsNone(self.lookup('555')['type'])
+        self.assertIsNone(self.lookup('')['type'])
+
+    def test_import_normalizes(self):
+        lines = ['first_name,second_name,status,phone_number', 'Olga,Sidorova,V,123.456.7800']
+        created, errors = customer_import.import_customers(lines, self.sp.pk)
+        self.assertEqual((created, errors), (1, []))
+        self.assertEqual(self.lookup('1234567800')['name'], 'Olga Sidorova')
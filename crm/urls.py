@@ -3,15 +3,15 @@
 from django.conf.urls import url
 
 
-from crm.views.customer_views import CustomerUpdateView, CustomerDeleteView, CustomerCreateView
-from crm.views.product_views import ProductDeleteView, ProductUpdateView, ProductCreateView
+from crm.views.customer_views import CustomerUpdateView, CustomerDeleteView, CustomerCreateView, CustomerImportView
+from crm.views.product_views import ProductDeleteView, ProductUpdateView, ProductCreateView, product_search
 from crm.views.salesperson_views import SalesPersonUpdateView, SalesPersonDeleteView, SalesPersonCreateView
 from crm.filters import DealFilter, DealFilterWithoutData, TodoFilter, TodoFilterWithoutData, ReportFilter
 from crm.views.table_views import tableSalesPerson, tableFilterDeals, tableFilterToDos, tableFilterCustomer, \
     tableProducts
 from crm.views.deal_views import DealUpdateView, DealCreateView, DealDeleteView
 from crm.views.todo_views import ToDoUpdateView, ToDoCreateView, ToDoDeleteView
-from crm.views.views import reportFunnel, reportSalesPerson
+from crm.views.views import reportFunnel, reportSalesPerson, search, phone_lookup
 from crm.models import Deal
 
 
@@ -33,6 +33,7 @@ urlpatterns = [
     url(r'^products/del/(?P<pk>[0-9]+)/$', ProductDeleteView.as_view(), name='product_del'),
     url(r'^products/$', tableProducts, name='products'),
     url(r'^products/new/$', ProductCreateView.as_view(), name='product_new'),
+    url(r'^products/search/$', product_search, name='product_search'),
 
     # ---------------------------- ToDo ------------------------------------------------------------
 
@@ -46,6 +47,8 @@ urlpatterns = [
     url(r'^todostoday/$', tableFilterToDos, {'classFilter': TodoFilterWithoutData, 'duration': 'day'}, name='todostoday'),
     url(r'^todosmonth/$', tableFilterToDos, {'classFilter': TodoFilterWithoutData,  'duration': 'month'}, name='todosmonth'),
     url(r'^todosyear/$', tableFilterToDos, {'classFilter': TodoFilterWithoutData,  'duration': 'year'}, name='todosyear'),
+    url(r'^todoslast/$', tableFilterToDos, {'classFilter': TodoFilterWithoutData,  'duration': 'last'}, name='todoslast'),
+    url(r'^todosperiod/$', tableFilterToDos, {'classFilter': TodoFilterWithoutData,  'duration': 'period'}, name='todosperiod'),
 
     # ------------------------- Customer -----------------------------------------------------------------------
 
@@ -53,6 +56,7 @@ urlpatterns = [
     url(r'^customers/del/(?P<pk>[0-9]+)/$', CustomerDeleteView.as_view(), name='customer_del'),
     url(r'^customers/$', tableFilterCustomer, name='customers'),
     url(r'^customers/new/$', CustomerCreateView.as_view(), name='customer_new'),
+    url(r'^customers/import/$', CustomerImportView.as_view(), name='customer_import'),
 
     # ----------------------------- Deal -------------------------------------------------------------------------
 
@@ -66,11 +70,18 @@ urlpatterns = [
     url(r'^dealstoday/$', tableFilterDeals, {'classFilter': DealFilterWithoutData, 'duration': 'day'}, name='dealstoday'),
     url(r'^dealsmonth/$', tableFilterDeals, {'classFilter': DealFilterWithoutData,  'duration': 'month'}, name='dealsmonth'),
     url(r'^dealsyear/$', tableFilterDeals, {'classFilter': DealFilterWithoutData,  'duration': 'year'}, name='dealsyear'),
+    url(r'^dealslast/$', tableFilterDeals, {'classFilter': DealFilterWithoutData,  'duration': 'last'}, name='dealslast'),
+    url(r'^dealsperiod/$', tableFilterDeals, {'classFilter': DealFilterWithoutData,  'duration': 'period'}, name='dealsperiod'),
 
     # ---------------------------------------------- Reports ------------------------------------------
 
     url(r'^reportfunnel/$', reportFunnel,  {'model': Deal, 'classFilter': ReportFilter}, name='reportfunnel'),
     url(r'^reportsp/$', reportSalesPerson, {'model': Deal, 'classFilter': DealFilter}, name='reportsp'),
 
+    # ---------------------------------------------- Search ------------------------------------------
+
+    url(r'^search/$', search, name='search'),
+    url(r'^phone/$', phone_lookup, name='phone_lookup'),
+
 ]
 
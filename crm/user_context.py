@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+# Data of the current user which almost every view needs ( SalesPerson, role, language and groups ).
+# It is resolved once and kept in the session, so the views don't load User, SalesPerson and groups again
+# and again. The session copy is dropped when SalesPerson or groups of the user change ( see crm.signals )
+# or when it becomes older than USER_CONTEXT_TIMEOUT. The role decides which rows and forms the user gets,
+# so the version of the context is kept in a cache shared by all processes ( settings.USER_CONTEXT_CACHE ).
+
+import time
+
+from django.core.cache import caches
+from django.db import connection
+from django.utils.functional import SimpleLazyObject
+
+from crm.models import SalesPerson
+from simpleCRM import settings
+
+SESSION_KEY = 'crm_user_context'
+
+
+class UserContext(object):
+
+    def __init__(self, user_id=None, sales_person_id=None, role=None, lang=None, groups=()):
+        self.user_id = user_id
+        self.sales_person_id = sales_person_id
+        self.role = role
+        self.groups = frozenset(groups)
+        self._lang = lang
+
+    @property
+    def lang(self):
+        # Users without SalesPerson ( admins ) see the site in the chosen language of the site
+        return self._lang or settings.MY_LANG_CODE
+
+    @property
+    def is_boss(self):
+        return 'boss' in self.groups
+
+    @property
+    def is_admin(self):
+        return 'admin' in self.groups
+
+    @property
+    def is_manager(self):
+        return 'manager' in self.groups
+
+    @property
+    def has_sales_person(self):
+        return self.sales_person_id is not None
+
+    def as_dict(self):
+        return {'user_id': self.user_id, 'sales_person_id': self.sales_person_id, 'role': self.role,
+                'lang': self._lang, 'groups': sorted(self.groups)}
+
+    @classmethod
+    def from_user(cls, user):
+        if not user.is_authenticated():
+            return cls()
+        sp = SalesPerson.objects.filter(user=user).values('pk', 'role', 'lang').first() or {}
+        groups = user.groups.values_list('name', flat=True)
+        return cls(user.pk, sp.get('pk'), sp.get('role'), sp.get('lang'), groups)
+
+
+def get_cache():
+    return caches[getattr(settings, 'USER_CONTEXT_CACHE', 'default')]
+
+
+def version_key(user_id, schema=None):
+    return 'crm_user_context:%s:%s' % (schema or connection.schema_name, user_id)
+
+
+def invalidate_user_context(user_id):
+    # Sessions of the user will resolve the context again on the next request
+    get_cache().set(version_key(user_id), time.time(), None)
+
+
+def get_user_context(request, refresh=False):
+    """
+    Return UserContext of request.user from the session, resolving it from DB only if the session copy
+    is absent, belongs to other user, is stale or refresh is True.
+    """
+    user = request.user
+    session = getattr(request, 'session', None)
+    cached = session.get(SESSION_KEY) if session is not None else None
+
+    if cached and not refresh and cached['user_id'] == user.pk:
+        version = get_cache().get(version_key(user.pk), 0)
+        timeout = getattr(settings, 'USER_CONTEXT_TIMEOUT', 300)
+        if cached['resolved'] > version and time.time() - cached['resolved'] < timeout:
+            data = dict(cached)
+            del data['resolved']
+            return UserContext(**data)
+
+    context = UserContext.from_user(user)
+    if session is not None and context.user_id is not None:
+        data = context.as_dict()
+        data['resolved'] = time.time()
+        session[SESSION_KEY] = data
+    return context
+
+
+class UserContextMiddleware(object):
+    """
+    Put UserContext into request.crm_user. It is lazy, so requests which don't use it pay nothing.
+    Must be after SessionMiddleware and AuthenticationMiddleware.
+    """
+
+    def process_request(self, request):
+        request.crm_user = SimpleLazyObject(lambda: get_user_context(request))
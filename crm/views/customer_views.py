@@ -1,19 +1,26 @@
 # -*- coding: utf-8 -*-#
+import io
+
 from django.contrib.auth.decorators import permission_required
 from django.utils import translation
 from django.utils.decorators import method_decorator
+from django.utils.translation import ugettext as _
 from django.views.generic import CreateView
 from django.views.generic import DeleteView
+from django.views.generic import FormView
 from django.core.urlresolvers import reverse
 from django.views.generic import UpdateView
 
-from crm.forms import CustomerForm
-from crm.models import Customer
+from crm.customer_import import import_customers
+from crm.forms import CustomerForm, CustomerImportForm
+from crm.mixin import ScopedQuerysetMixin
+from crm.models import Customer, SalesPerson
+from crm.permissions import is_scoped
 
 __author__ = 'AMA'
 
 
-class CustomerDeleteView(DeleteView):
+class CustomerDeleteView(ScopedQuerysetMixin, DeleteView):
     model = Customer
     template_name = 'crm/customer_del.html'
 
@@ -22,11 +29,11 @@ class CustomerDeleteView(DeleteView):
 
     @method_decorator(permission_required('crm.delete_customer'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
 
-class CustomerUpdateView(UpdateView):
+class CustomerUpdateView(ScopedQuerysetMixin, UpdateView):
     model = Customer
     form_class = CustomerForm
     template_name = 'crm/customer.html'
@@ -36,7 +43,7 @@ class CustomerUpdateView(UpdateView):
 
     @method_decorator(permission_required('crm.change_customer'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(permission_required('crm.change_customer'))
@@ -54,9 +61,49 @@ class CustomerCreateView(CreateView):
 
     @method_decorator(permission_required('crm.add_customer'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(permission_required('crm.add_customer'))
     def post(self, request, *args, **kwargs):
-        return super().post(self, request, *args, **kwargs)
\ No newline at end of file
+        return super().post(self, request, *args, **kwargs)
+
+
+class CustomerImportView(FormView):
+    template_name = 'crm/customer_import.html'
+    form_class = CustomerImportForm
+
+    @method_decorator(permission_required('crm.add_customer'))
+    def get(self, request, *args, **kwargs):
+        translation.activate(request.crm_user.lang)
+        return super().get(self, request, *args, **kwargs)
+
+    @method_decorator(permission_required('crm.add_customer'))
+    def post(self, request, *args, **kwargs):
+        return super().post(self, request, *args, **kwargs)
+
+    def get_form(self, form_class=None):
+        form = super().get_form(form_class)
+        if is_scoped(self.request):
+            # a manager imports customers for himself only ( settings.ROW_SCOPING )
+            form.fields['sales_person'].queryset = SalesPerson.objects.filter(
+                pk=self.request.crm_user.sales_person_id)
+        return form
+
+    def form_valid(self, form):
+        sales_person = form.cleaned_data['sales_person']
+        owner = None
+        if is_scoped(self.request):
+            owner = self.request.crm_user.sales_person_id
+            if owner is None:
+                form.add_error(None, _('Импорт доступен только менеджерам по продажам'))
+                return self.form_invalid(form)
+        # utf-8-sig skips BOM of files saved by Excel. Other encodings ( e.g. cp1251 of Excel ) are refused,
+        # nothing is imported then, as the import is one transaction
+        lines = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', errors='strict')
+        try:
+            created, errors = import_customers(lines, sales_person.pk if sales_person else None, owner=owner)
+        except UnicodeDecodeError:
+            form.add_error('file', _('Файл должен быть в кодировке UTF-8 ( "CSV UTF-8" в Excel )'))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, created=created, errors=errors))
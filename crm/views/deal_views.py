@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-#
 
 import datetime
+from decimal import Decimal, InvalidOperation
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
@@ -12,43 +13,43 @@ from django.utils.decorators import method_decorator
 from django.views.generic import UpdateView, CreateView
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import DeleteView
-from django.contrib.auth.models import User
 
-from datetimewidget.widgets import DateWidget, TimeWidget
 from guardian.decorators import permission_required
 from guardian.shortcuts import assign_perm
 from crm.forms import BossDealForm, DealProductForm, DealStatusForm, ManagerDealForm
-from crm.mixin import SomeUtilsMixin
-from crm.models import Deal, DealProducts, DealStatus, Product, SalesPerson
+from crm.mixin import SomeUtilsMixin, ScopedQuerysetMixin
+from crm.models import Deal, DealProducts, DealStatus, Product
+from simpleCRM import settings
 
 
-class DealUpdateView(UpdateView, SomeUtilsMixin):
+# Formset classes are built once, not for every request
+ProductFormset = modelformset_factory(model=DealProducts, form=DealProductForm, extra=1, can_delete=True)
+StatusFormset = modelformset_factory(model=DealStatus, form=DealStatusForm, extra=1, can_delete=True)
+
+
+class DealUpdateView(ScopedQuerysetMixin, UpdateView, SomeUtilsMixin):
     model = Deal
     form_class = BossDealForm
     template_name = 'crm/deal.html'
+    ProductFormset = ProductFormset
+    StatusFormset = StatusFormset
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.total_deal_price = 0
-
-        self.ProductFormset = modelformset_factory(model=DealProducts, form=DealProductForm, extra=1, can_delete=True)
-        self.StatusFormset = modelformset_factory(model=DealStatus, form=DealStatusForm, extra=1, can_delete=True)
+        self.total_deal_price = Decimal('0.00')
+        # Numbers of product forms without a valid total price ( see change_request_product )
+        self.invalid_products = []
 
     def get_success_url(self):
         return reverse('dealpage', kwargs={'pk': self.kwargs['pk']})
 
+    def get_form_class(self):
+        return BossDealForm if self.request.crm_user.is_boss else ManagerDealForm
+
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.read_deal', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
-        self.req = request
-        user = User.objects.get(username=request.user.username)
-
-        if user.groups.filter(name='boss').exists():
-            DealUpdateView.form_class = BossDealForm
-        else:
-            DealUpdateView.form_class = ManagerDealForm
-
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     # Add some more context ( formset )
@@ -56,28 +57,18 @@ class DealUpdateView(UpdateView, SomeUtilsMixin):
 
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
-        # Add in a QuerySet of all the books
-        context['formset_products'] = self.ProductFormset(queryset=DealProducts.objects.filter(deal=self.kwargs['pk']),
-                                                          prefix='products')
-        context['formset_status'] = self.StatusFormset(queryset=DealStatus.objects.filter(deal=self.kwargs['pk']),
-                                                       prefix='status')
-        # We must set uniq id for each datetime picker in each form
-        for i, f in enumerate(context['formset_status']):
-            std = 'yourdateid' + str(i)
-            stt = 'yourtimeid' + str(i)
-            f.fields['deal_data'].widget = DateWidget(attrs={'id': std}, usel10n=True, bootstrap_version=3)
-            f.fields['deal_time'].widget = TimeWidget(attrs={'id': stt}, usel10n=True, bootstrap_version=3)
+        # Add in a QuerySet of all the books ( the posted formsets are shown again, if the form has errors )
+        if 'formset_products' not in context:
+            context['formset_products'] = self.ProductFormset(
+                queryset=DealProducts.objects.filter(deal=self.kwargs['pk']), prefix='products')
+        if 'formset_status' not in context:
+            context['formset_status'] = self.StatusFormset(
+                queryset=DealStatus.objects.filter(deal=self.kwargs['pk']), prefix='status')
+        # Every datetime picker gets uniq id from its form prefix ( see DealStatusForm )
 
         # Patch for initial data for readonly field
-        try:
-            # If form has errors self.req will undefined and we must handled it
-            user = User.objects.get(username=self.req.user)
-
-            if not user.groups.filter(name='boss').exists():
-                sales_person = SalesPerson.objects.get(user=user)
-                context['form'].fields['sales_person'].initial = sales_person
-        except:
-            pass
+        if not self.request.crm_user.is_boss:
+            context['form'].fields['sales_person'].initial = self.request.crm_user.sales_person_id
 
         return context
 
@@ -88,22 +79,28 @@ class DealUpdateView(UpdateView, SomeUtilsMixin):
         if not self.checkPermissions(request, Deal, 'crm.change_deal'):
             return HttpResponseRedirect(reverse('login'))
 
+        # QueryDict of the request is immutable, the hidden fields are filled below
+        request.POST = request.POST.copy()
         request = self.change_request_product(request)
         request = self.change_request_status(request)
 
         # .save() update record if instance argument is present, but another way .save create new record
-        a = Deal.objects.get(pk=self.kwargs['pk'])
+        a = self.object = self.get_object()
         form = BossDealForm(request.POST, instance=a)
         product_formset = self.ProductFormset(request.POST, prefix='products')
         status_formset = self.StatusFormset(request.POST, prefix='status')
 
         # Patch for initial data for readonly field
-        user = User.objects.get(username=request.user)
-
-        if not user.groups.filter(name='boss').exists():
+        if not request.crm_user.is_boss:
             # Patch for solve problem with hidden field
-            sp = SalesPerson.objects.get(user=request.user)
-            form.data['sales_person'] = sp.pk
+            form.data['sales_person'] = request.crm_user.sales_person_id
+
+        if self.invalid_products:
+            lines = ', '.join(str(i + 1) for i in self.invalid_products)
+            form.add_error(None, _('Не удалось вычислить цену продуктов в строках: %s') % lines)
+            messages.error(request, _('Что-то пошло не так'))
+            return self.render_to_response(self.get_context_data(form=form, formset_products=product_formset,
+                                                                 formset_status=status_formset))
 
         if form.is_valid() and product_formset.is_valid() and status_formset.is_valid():
             form.data['price'] = str(self.total_deal_price)
@@ -122,11 +119,20 @@ class DealUpdateView(UpdateView, SomeUtilsMixin):
         1. Deal field is hidden and don't fill proper value. We need fill it correct value before saving.
         2. User may delete product field from django-select2 widget and we must to mark this form in formset as DELETED
         3. If item price or total price is empty that we need to calc their for every form in formset
+        4. Forms whose total price is still not a number are put into self.invalid_products
 
         """
         prefix = 'products-'
         s = prefix + 'TOTAL_FORMS'
-        for i in range(int(request.POST[s])):
+        total_forms = int(request.POST[s])
+
+        # Resolve all products of the formset with one query instead of a query per form
+        product_ids = [request.POST.get(prefix + str(i) + '-product', '') for i in range(total_forms)]
+        products = Product.objects.in_bulk([int(pk) for pk in product_ids if str(pk).isdigit()])
+        total_deal_price = Decimal('0.00')
+        invalid_products = []
+
+        for i in range(total_forms):
 
             product = prefix + str(i) + '-product'
             item_price = prefix + str(i) + '-item_price'
@@ -137,27 +143,33 @@ class DealUpdateView(UpdateView, SomeUtilsMixin):
 
             # if group or individual price field is empty, try get product price from Product model
             # and set group and individual price
-            if request.POST[item_price] == '0' or request.POST[total_price] == '0' \
-                    or request.POST[item_price] == '' or request.POST[total_price] == '':
+            if request.POST.get(item_price) in ('0', '', None) or request.POST.get(total_price) in ('0', '', None):
+                pr = products.get(int(product_ids[i])) if str(product_ids[i]).isdigit() else None
                 try:
-                    pr = Product.objects.get(pk=request.POST[product])
+                    request.POST[total_price] = str(Decimal(pr.price) * Decimal(request.POST[qty]))
                     request.POST[item_price] = pr.price
-                    request.POST[total_price] = str(int(pr.price) * int(request.POST[qty]))
-                except:
+                except (AttributeError, KeyError, ValueError, TypeError, InvalidOperation):
                     pass
-            if len(request.POST[product]) > 0:
+            if len(product_ids[i]) > 0:
                 # Deal field does not set in template and therefore we must to setup his manually
                 request.POST[deal] = self.kwargs['pk']
                 # Count total price only for undeleted fields
-                try:
-                    if request.POST[delete] != 'on':
-                        self.total_deal_price += int(request.POST[total_price])
-                except:
-                    self.total_deal_price += int(request.POST[total_price])
+                if request.POST.get(delete) != 'on':
+                    try:
+                        price = Decimal(request.POST.get(total_price))
+                        if not price.is_finite():
+                            raise InvalidOperation(price)
+                        total_deal_price += price
+                    except (TypeError, InvalidOperation):
+                        # e.g. the product was not found and the price is empty
+                        invalid_products.append(i)
             else:
                 # If product field is absent so his is deleted.
                 request.POST[delete] = 'on'
 
+        # The same precision as Deal.price has
+        self.total_deal_price += total_deal_price.quantize(Decimal('0.01'))
+        self.invalid_products = invalid_products
         return request
 
     def change_request_status(self, request):
@@ -195,18 +207,13 @@ class DealCreateView(CreateView):
     def get_success_url(self):
         return reverse('deals')
 
+    def get_form_class(self):
+        return BossDealForm if self.request.crm_user.is_boss else ManagerDealForm
+
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.add_deal', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
-        self.req = request
-        user = User.objects.get(username=request.user.username)
-
-        if user.groups.filter(name='boss').exists():
-            DealCreateView.form_class = BossDealForm
-        else:
-            DealCreateView.form_class = ManagerDealForm
-
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     # Add some more context ( formset )
@@ -219,15 +226,8 @@ class DealCreateView(CreateView):
         context['ff'] = DealStatusForm(data)
 
         # Patch for initial data for readonly field
-        try:
-            # If form has errors self.req will undefined and we must handled it
-            user = User.objects.get(username=self.req.user)
-
-            if not user.groups.filter(name='boss').exists():
-                sales_person = SalesPerson.objects.get(user=user)
-                context['form'].fields['sales_person'].initial = sales_person
-        except:
-            pass
+        if not self.request.crm_user.is_boss:
+            context['form'].fields['sales_person'].initial = self.request.crm_user.sales_person_id
 
         return context
 
@@ -242,12 +242,9 @@ class DealCreateView(CreateView):
         status_form = DealStatusForm(request.POST)
 
         # Patch for initial data for readonly field
-        user = User.objects.get(username=request.user)
-
-        if not user.groups.filter(name='boss').exists():
+        if not request.crm_user.is_boss:
             # Patch for solve problem with hidden field
-            sp = SalesPerson.objects.get(user=request.user)
-            form.data['sales_person'] = sp.pk
+            form.data['sales_person'] = request.crm_user.sales_person_id
 
         if form.is_valid() and product_form.is_valid() and status_form.is_valid():
             record = form.save()
@@ -257,10 +254,11 @@ class DealCreateView(CreateView):
             sf.deal = record
             pf.save()
             sf.save()
-            sales_person=record.sales_person
-            user = User.objects.get(username=sales_person.user)
-            assign_perm('crm.change_deal', user, record)
-            assign_perm('crm.delete_deal', user, record)
+            if not settings.ROW_SCOPING:
+                # with the row scoping the owner has the rights by the rule, without rows per deal
+                user = record.sales_person.user
+                assign_perm('crm.change_deal', user, record)
+                assign_perm('crm.delete_deal', user, record)
             return HttpResponseRedirect(reverse('deals'))
 
         return super().post(self, request, *args, **kwargs)
@@ -298,7 +296,7 @@ class DealCreateView(CreateView):
         return request
 
 
-class DealDeleteView(DeleteView, SomeUtilsMixin):
+class DealDeleteView(ScopedQuerysetMixin, DeleteView, SomeUtilsMixin):
     model = Deal
     template_name = 'crm/deal_del.html'
 
@@ -307,7 +305,7 @@ class DealDeleteView(DeleteView, SomeUtilsMixin):
 
     @method_decorator(login_required())
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         if not self.checkPermissions(request, Deal, 'crm.delete_deal'):
             return HttpResponseRedirect(reverse('login'))
         return super().get(self, request, *args, **kwargs)
@@ -1,5 +1,11 @@
 # -*- coding: utf-8 -*-#
+import hashlib
+
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import permission_required as perm_req_std
+from django.core.cache import cache
+from django.db import connection
+from django.http import JsonResponse
 from django.utils import translation
 from django.utils.decorators import method_decorator
 from django.views.generic import CreateView
@@ -12,6 +18,7 @@ from guardian.decorators import permission_required
 from crm.forms import ProductForm
 from crm.mixin import add_lang
 from crm.models import Product
+from simpleCRM import settings
 
 __author__ = 'AMA'
 
@@ -26,7 +33,7 @@ class ProductDeleteView(DeleteView):
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.delete_product', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
 
@@ -41,7 +48,7 @@ class ProductUpdateView(UpdateView):
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.change_product', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(login_required())
@@ -61,10 +68,32 @@ class ProductCreateView(CreateView):
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.add_product', accept_global_perms=True))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(login_required())
     @method_decorator(permission_required('crm.add_product', accept_global_perms=True))
     def post(self, request, *args, **kwargs):
-        return super().post(self, request, *args, **kwargs)
\ No newline at end of file
+        return super().post(self, request, *args, **kwargs)
+
+
+@login_required
+@perm_req_std('crm.read_product')
+def product_search(request):
+    '''
+    JSON for the select2 product picker: {"results": [{"id": pk, "text": "sku description"}], "more": false}.
+    Results are limited by PRODUCT_SEARCH_LIMIT and cached for a short time per tenant and term.
+    '''
+    term = request.GET.get('term', '').strip()
+    if not term:
+        return JsonResponse({'results': [], 'more': False})
+
+    key = 'product_search:%s:%s' % (connection.schema_name,
+                                    hashlib.md5(term.lower().encode('utf-8')).hexdigest())
+    results = cache.get(key)
+    if results is None:
+        limit = settings.PRODUCT_SEARCH_LIMIT
+        rows = Product.objects.search(term).order_by('sku').values_list('id', 'sku', 'description')[:limit]
+        results = [{'id': pk, 'text': '%s %s' % (sku, description[:100])} for pk, sku, description in rows]
+        cache.set(key, results, settings.PRODUCT_SEARCH_CACHE_TIMEOUT)
+    return JsonResponse({'results': results, 'more': False})
@@ -1,19 +1,20 @@
 # -*- coding: utf-8 -*-#
 
-import datetime
-
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import permission_required as perm_req_std
 from django.db.models import F
 from django.shortcuts import render
 from django.utils import translation
-from django_tables2 import RequestConfig
 
 from guardian.decorators import permission_required
 
 from crm.models import SalesPerson, Deal, Todo, Customer, Product
 from crm.tables import SalesPersonTable, DealsTable, ToDosTable, CustomersTable, ProductTable
-from crm.mixin import SomeUtilsMixin, add_lang
+from crm.forms import LastDaysForm, PeriodForm
+from crm.mixin import add_lang, period_range
+from crm.pagination import configure_table
+from crm.export import export_table
+from crm.permissions import prefetch_perms, page_records, scope_queryset
 
 __author__ = 'AMA'
 
@@ -23,10 +24,9 @@ __author__ = 'AMA'
 @add_lang
 def tableSalesPerson(request):
     queryset = SalesPerson.objects.annotate(email=F('user__email'))
-    table = SalesPersonTable(queryset)
-    RequestConfig(request).configure(table)
+    table, paging = configure_table(request, SalesPersonTable, queryset)
     filter = 'NONFILTER'
-    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter})
+    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter, 'paging': paging})
 
 
 @login_required
@@ -34,10 +34,9 @@ def tableSalesPerson(request):
 @add_lang
 def tableProducts(request):
     queryset = Product.objects.all()
-    table = ProductTable(queryset)
-    RequestConfig(request).configure(table)
+    table, paging = configure_table(request, ProductTable, queryset)
     filter = 'NONFILTER'
-    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter})
+    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter, 'paging': paging})
 
 
 @login_required
@@ -48,43 +47,49 @@ def tableFilterDeals(request, classFilter=None, duration=None):
     Функция комбинированного показа фильтров и результата фильтрования чрезе таблицы
     Может не содержать фитьтров вообще, тогда classFilter=None . Duration определяет предфильтрацию перед фильтрами.
     '''
-    now_date = datetime.date.today()  # Текущая дата (без времени)
-
-    queryset = Deal.objects.all()
-    # add some fields from different models
-    queryset = queryset.annotate(deal_data=F('dealstatus__deal_data'))
-    queryset = queryset.annotate(deal_time=F('dealstatus__deal_time'))
-    queryset = queryset.annotate(deal_status=F('dealstatus__status'))
-
-    # Delete deals duplicates
-    for query in queryset:
-        queryset_deal = queryset.filter(pk=query.pk).order_by('-deal_data', '-deal_time')
-        if len(queryset_deal) > 1:
-            for query in queryset_deal[1:]:
-                queryset = queryset.exclude(pk=query.pk, deal_data=query.deal_data, deal_time=query.deal_time)
+    # add the newest status of every deal ( date, time and status ) in one query
+    queryset = scope_queryset(request, Deal.objects.with_latest_status())
 
     # Add some filters
+    period_form = None
     if classFilter:
-        if duration == 'day':
-            queryset = queryset.filter(deal_data__year=now_date.year)
-            queryset = queryset.filter(deal_data__month=now_date.month)
-            queryset = queryset.filter(deal_data__day=now_date.day)
-        elif duration == 'month':
-            queryset = queryset.filter(deal_data__year=now_date.year)
-            queryset = queryset.filter(deal_data__month=now_date.month)
-        elif duration == 'year':
-            queryset = queryset.filter(deal_data__year=now_date.year)
-
+        queryset, period_form = filterByPeriod(request, queryset, 'deal_data', duration)
         filter = classFilter(request.GET, queryset=queryset)
         queryset = filter.qs
     else:
         filter = 'NONFILTER'
 
-    queryset = SomeUtilsMixin.doHumanReadble_STATUS_CHOICES(0, queryset)
-    table = DealsTable(queryset)
-    RequestConfig(request).configure(table)
+    if request.GET.get('export') == 'csv':
+        return export_table(DealsTable, queryset, 'deals')
 
-    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter})
+    table, paging = configure_table(request, DealsTable, queryset, '-deal_data')
+    # object permissions of all the shown deals by one go, for the edit / delete links
+    table.request = request
+    prefetch_perms(request, page_records(table), ('crm.change_deal', 'crm.delete_deal'))
+
+    return render(request, 'crm/common_table_list.html',
+                  {'table': table, 'filter': filter, 'period_form': period_form, 'paging': paging,
+                   'export': True})
+
+
+def filterByPeriod(request, queryset, field, duration):
+    '''
+    Pre-filter by a half-open date range ( see period_range ). Return the queryset and the form with
+    parameters of the range, if the duration has any.
+    '''
+    form = None
+    params = {}
+    if duration in ('last', 'period'):
+        form = LastDaysForm(request.GET) if duration == 'last' else PeriodForm(request.GET)
+        if form.is_valid():
+            params = form.cleaned_data
+
+    start, end = period_range(duration, params)
+    if start:
+        queryset = queryset.filter(**{field + '__gte': start})
+    if end:
+        queryset = queryset.filter(**{field + '__lt': end})
+    return queryset, form
 
 
 @login_required
@@ -95,30 +100,25 @@ def tableFilterToDos(request, classFilter=None, duration=None):
     Функция комбинированного показа фильтров и результата фильтрования чрезе таблицы
     Может не содержать фитьтров вообще, тогда classFilter=None . Duration определяет предфильтрацию перед фильтрами.
     '''
-    now_date = datetime.date.today()  # Текущая дата (без времени)
-    queryset = Todo.objects.all()
+    queryset = scope_queryset(request, Todo.objects.all())
 
     # Add some filters
+    period_form = None
     if classFilter:
-        if duration == 'day':
-            queryset = queryset.filter(todo_data__year=now_date.year)
-            queryset = queryset.filter(todo_data__month=now_date.month)
-            queryset = queryset.filter(todo_data__day=now_date.day)
-        elif duration == 'month':
-            queryset = queryset.filter(todo_data__year=now_date.year)
-            queryset = queryset.filter(todo_data__month=now_date.month)
-        elif duration == 'year':
-            queryset = queryset.filter(todo_data__year=now_date.year)
-
+        queryset, period_form = filterByPeriod(request, queryset, 'todo_data', duration)
         filter = classFilter(request.GET, queryset=queryset)
         queryset = filter.qs
     else:
         filter = 'NONFILTER'
 
-    table = ToDosTable(queryset)
-    RequestConfig(request).configure(table)
+    if request.GET.get('export') == 'csv':
+        return export_table(ToDosTable, queryset, 'todos')
+
+    table, paging = configure_table(request, ToDosTable, queryset, '-todo_data')
 
-    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter})
+    return render(request, 'crm/common_table_list.html',
+                  {'table': table, 'filter': filter, 'period_form': period_form, 'paging': paging,
+                   'export': True})
 
 
 @perm_req_std('crm.read_customer')
@@ -129,10 +129,13 @@ def tableFilterCustomer(request, classFilter=None, duration=None):
     Может не содержать фитьтров вообще, тогда classFilter=None . Duration определяет предфильтрацию перед фильтрами.
     '''
 
-    queryset = Customer.objects.all()
+    queryset = scope_queryset(request, Customer.objects.all())
     filter = 'NONFILTER'
 
-    table = CustomersTable(queryset)
-    RequestConfig(request).configure(table)
+    if request.GET.get('export') == 'csv':
+        return export_table(CustomersTable, queryset, 'customers')
+
+    table, paging = configure_table(request, CustomersTable, queryset)
 
-    return render(request, 'crm/common_table_list.html', {'table': table, 'filter': filter})
+    return render(request, 'crm/common_table_list.html',
+                  {'table': table, 'filter': filter, 'paging': paging, 'export': True})
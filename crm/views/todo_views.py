@@ -8,12 +8,13 @@ from django.core.urlresolvers import reverse
 from django.views.generic import UpdateView
 
 from crm.forms import ToDoForm
+from crm.mixin import ScopedQuerysetMixin
 from crm.models import Todo
 
 __author__ = 'AMA'
 
 
-class ToDoDeleteView(DeleteView):
+class ToDoDeleteView(ScopedQuerysetMixin, DeleteView):
     model = Todo
     form_class = ToDoForm
     template_name = 'crm/todo_del.html'
@@ -23,11 +24,11 @@ class ToDoDeleteView(DeleteView):
 
     @method_decorator(permission_required('crm.delete_todo'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
 
-class ToDoUpdateView(UpdateView):
+class ToDoUpdateView(ScopedQuerysetMixin, UpdateView):
     model = Todo
     form_class = ToDoForm
     template_name = 'crm/todo.html'
@@ -37,7 +38,7 @@ class ToDoUpdateView(UpdateView):
 
     @method_decorator(permission_required('crm.change_todo'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(permission_required('crm.change_todo'))
@@ -55,7 +56,7 @@ class ToDoCreateView(CreateView):
 
     @method_decorator(permission_required('crm.add_todo'))
     def get(self, request, *args, **kwargs):
-        translation.activate(request.user.salesperson.lang)
+        translation.activate(request.crm_user.lang)
         return super().get(self, request, *args, **kwargs)
 
     @method_decorator(permission_required('crm.add_todo'))
@@ -1,72 +1,75 @@
-import time, datetime, math
+import datetime
 
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import permission_required as perm_req_std
+from django.core.urlresolvers import reverse
+from django.http import JsonResponse
 from django.shortcuts import render
-from django.db.models import Sum, F, Q
+from django.db.models import Min, Max, Sum, Q
 from django.contrib import messages
 from django.utils.translation import ugettext as _
 
+from crm.forms import ChartForm, FunnelForm
 from crm.mixin import add_lang
+from crm.models import Customer, Deal, Todo, SalesPerson, normalize_phone
+from crm.search import search_queryset
+from crm.permissions import scope_queryset
+from crm.report_cache import cached_report
+from crm.reports import sales_time_series, sales_funnel, sales_funnel_rollup, rollup_queryset
+from simpleCRM import settings
 
 
 @perm_req_std('crm.read_customer')
 @add_lang
 def reportSalesPerson(request, model, modelTable=None, classFilter=None):
-    queryset = model.objects.all()
-    # Extend a query additional data from related models
-    queryset = queryset.annotate(deal_data=F('dealstatus__deal_data'))
-    queryset = queryset.annotate(deal_time=F('dealstatus__deal_time'))
-    queryset = queryset.annotate(deal_status=F('dealstatus__status'))
+    # Every deal with its latest status ( deal_data, deal_time, deal_status )
+    queryset = scope_queryset(request, model.objects.with_latest_status())
 
     filter = classFilter(request.GET, queryset=queryset)
     queryset = filter.qs
 
-    # compute the date range for the chart
-    try:
-        queryset = queryset.exclude(deal_data__isnull=True)
-        data_min = queryset.earliest("deal_data").deal_data
-        data_max = queryset.latest("deal_data").deal_data
-        queryset = queryset.filter(deal_data__gte=data_min, deal_data__lte=data_max)
-    except:
+    chart_form = ChartForm(request.GET)
+    # cleaned_data of an invalid form misses the bad fields, show the errors instead of the chart
+    if not filter.form.is_valid() or not chart_form.is_valid():
+        messages.error(request, _('Что-то пошло не так'))
+        return render(request, 'crm/report_sp.html', {'filter': filter, 'chart_form': chart_form})
+    buckets = chart_form.cleaned_data.get('buckets') or 20
+    granularity = chart_form.cleaned_data.get('granularity') or None
+
+    def compute():
+        if settings.REPORTS_FROM_ROLLUP:
+            source = scope_queryset(request, rollup_queryset(filter.form.cleaned_data)).filter(deal_count__gt=0)
+            date_field, total, qty = 'date', Sum('total_price'), Sum('deal_count')
+        else:
+            source = queryset.exclude(deal_data__isnull=True)
+            date_field, total, qty = 'current_status_date', None, None
+
+        # compute the date range for the chart
+        dates = source.aggregate(data_min=Min(date_field), data_max=Max(date_field))
+        data_min, data_max = dates['data_min'], dates['data_max']
+        if data_min is None or (granularity is None and data_max - data_min < datetime.timedelta(days=buckets)):
+            return data_min, data_max, None
+        # compute the price and qty deals of a selected date range
+        return data_min, data_max, sales_time_series(source, data_min, data_max, buckets, granularity,
+                                                     date_column=date_field, total=total, qty=qty)
+
+    data_min, data_max, series = cached_report('sales_person', request, compute)
+
+    if data_min is None:
         messages.error(request, _('Нет релевантных данных для выбранных параметров фильтров'))
-        return render(request, 'crm/report_sp.html', {'filter': filter})
-
-    # select only last deals and rejected other
-    for query in queryset:
-        deals = queryset.filter(ident=query.ident)
-        latest_data = deals.latest("deal_data").deal_data
-        latest_time = deals.filter(deal_data=latest_data).latest("deal_time").deal_time
-        queryset = queryset.exclude(Q(ident=query.ident) and ~Q(deal_time=latest_time), ident=query.ident)
-
-    delta = data_max - data_min
-    # round up step
-    step = datetime.timedelta(days=math.ceil(delta.days / 20))
+        return render(request, 'crm/report_sp.html', {'filter': filter, 'chart_form': chart_form})
 
     # too small date interval forbidden
-    if delta < datetime.timedelta(days=20) or data_min > data_max:
-        messages.error(request, _('Выбран слишком маленький или не правильный временной интервал ( минимум 20 дней ) '))
-        return render(request, 'crm/report_sp.html', {'filter': filter})
+    if series is None:
+        messages.error(request, _('Выбран слишком маленький или не правильный временной интервал'
+                                  ' ( минимум 1 день на точку графика ) '))
+        return render(request, 'crm/report_sp.html', {'filter': filter, 'chart_form': chart_form})
 
     # selected sales_person for display on chart
     sales_person = _('Все') if filter.form.cleaned_data['sales_person'] == None else filter.form.cleaned_data[
         'sales_person']
 
-    # compute the price and qty deals of a selected date range
-    xdata = []
-    ydata = []
-    ydata_qty = []
-    date_begin = data_min
-    point = int(time.mktime(date_begin.timetuple()) * 1000)
-    for x in range(20):
-        xdata.append(point)
-        date_end = date_begin + step
-        point = int(time.mktime(date_end.timetuple()) * 1000)
-        # the same record will be rejected
-        qs = queryset.filter(deal_data__gte=date_begin, deal_data__lte=date_end)
-        tp = qs.exclude(price__isnull=True).aggregate(total_price=Sum('price'))
-        ydata_qty.append(qs.count())
-        ydata.append(int(0 if tp['total_price'] == None else tp['total_price']))
-        date_begin = date_end
+    xdata, ydata, ydata_qty = series
 
     chartdata = {'x': xdata, 'y': ydata, 'name': str(sales_person)}
     charttype = "lineChart"
@@ -78,6 +81,7 @@ def reportSalesPerson(request, model, modelTable=None, classFilter=None):
 
     data = {
         'filter': filter,
+        'chart_form': chart_form,
         'charttype': charttype,
         'chartdata': chartdata,
         'chartcontainer': chartcontainer,
@@ -112,32 +116,80 @@ def reportFunnel(request, model, modelTable=None, classFilter=None):
         ('O', _('Контракт выполнен')),
         ('A', _('Мертвый контракт')),
     )
-    queryset = model.objects.all()
-    # Extend a query additional data from related models
-    queryset = queryset.annotate(deal_data=F('dealstatus__deal_data'))
-    queryset = queryset.annotate(deal_time=F('dealstatus__deal_time'))
-    queryset = queryset.annotate(deal_status=F('dealstatus__status'))
+    # Every deal with its latest status ( deal_data, deal_time, deal_status )
+    queryset = scope_queryset(request, model.objects.with_latest_status())
 
     filter = classFilter(request.GET, queryset=queryset)
     queryset = filter.qs
 
-    records = []
-    for status in STATUS_CHOICES:
-        records.append([status[1], queryset.filter(deal_status=status[0]).count()])
-
-    recordsMany = []
-    for status in STATUS_CHOICES:
-        record = [status[1]]
-        sum_pr = queryset.filter(deal_status=status[0]).aggregate(Sum('price'))
-        sum_str = str(sum_pr['price__sum'])
-        if sum_str == "None":
-            sum_str = '0'
-        sum_int = float(sum_str)
-        record.append(sum_int)
-        recordsMany.append(record)
+    funnel_form = FunnelForm(request.GET)
+    if not filter.form.is_valid():
+        messages.error(request, _('Что-то пошло не так'))
+        return render(request, 'crm/report_funnel.html', {'filter': filter, 'funnel_form': funnel_form})
+
+    ever_reached = funnel_form.is_valid() and funnel_form.cleaned_data['ever_reached']
+
+    # qty and money of every stage in one query
+    def compute():
+        if settings.REPORTS_FROM_ROLLUP:
+            return sales_funnel_rollup(scope_queryset(request, rollup_queryset(filter.form.cleaned_data)),
+                                       STATUS_CHOICES, ever_reached)
+        return sales_funnel(queryset, STATUS_CHOICES, ever_reached)
+
+    records, recordsMany, conversions = cached_report('funnel', request, compute)
 
     return render(request, 'crm/report_funnel.html',
-                  {'records': records, 'records_many': recordsMany, 'filter': filter})
+                  {'records': records, 'records_many': recordsMany, 'filter': filter,
+                   'funnel_form': funnel_form, 'conversions': conversions if ever_reached else None})
+
+
+@login_required
+def search(request):
+    '''
+    Global full-text search ( ?q= ): ranked customers, deals and todos the user can read, as JSON
+    {"customers": [{"id", "text", "url", "rank"}], "deals": [...], "todos": [...]}.
+    '''
+    term = request.GET.get('q', '').strip()
+    limit = settings.SEARCH_LIMIT
+    sources = (
+        ('customers', 'crm.read_customer', Customer, 'customer_page', ('first_name', 'second_name', 'company')),
+        ('deals', 'crm.read_deal', Deal, 'dealpage', ('ident', 'description')),
+        ('todos', 'crm.read_todo', Todo, 'todopage', ('action_description',)),
+    )
+    result = {}
+    for name, perm, model, url_name, fields in sources:
+        result[name] = []
+        if not term or not request.user.has_perm(perm):
+            continue
+        rows = search_queryset(scope_queryset(request, model.objects.all()), term).values('id', 'rank', *fields)
+        for row in rows[:limit]:
+            text = ' '.join(str(row[field]) for field in fields if row[field])
+            result[name].append({'id': row['id'], 'text': text[:100], 'url': reverse(url_name, args=[row['id']]),
+                                 'rank': round(row['rank'], 4)})
+    return JsonResponse(result)
+
+
+@login_required
+def phone_lookup(request):
+    '''
+    Who is calling ( ?number= in any format ): the customer, else the sales person with this phone or mobile number,
+    as JSON {"type": "customer" | "salesperson" | null, "id", "name", "url"}. Numbers are compared by
+    their normalized digits ( normalize_phone ), an exact match on the indexed phone_digits / mobile_digits columns.
+    '''
+    digits = normalize_phone(request.GET.get('number', ''))
+    sources = (
+        ('customer', 'crm.read_customer', scope_queryset(request, Customer.objects.all()), 'customer_page'),
+        ('salesperson', 'crm.read_salesperson', SalesPerson.objects.all(), 'salespersonpage'),
+    )
+    for name, perm, queryset, url_name in sources:
+        if not digits or not request.user.has_perm(perm):
+            continue
+        person = queryset.filter(Q(phone_digits=digits) | Q(mobile_digits=digits)).order_by('id').first()
+        if person:
+            return JsonResponse({'type': name, 'id': person.id, 'name': str(person),
+                                 'url': reverse(url_name, args=[person.id])})
+    return JsonResponse({'type': None})
+
 
 def main_page(request):
     context = {}
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import time
+
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import BaseCommand, CommandError
+from tenant_schemas.utils import schema_context, schema_exists
+
+from globalcustomer.models import Client
+from globalcustomer.provision import provision_tenant
+from simpleCRM import settings
+
+
+def copy_groups_one_by_one(schema_name):
+    # The copy of groups and permissions of the old GlobalClientCreateView ( a query per permission ),
+    # kept here as the baseline of the benchmark
+    all_perms = []
+    with schema_context('a1'):
+        groups = Group.objects.all()
+        for group in groups:
+            perms_list = []
+            for perm in group.permissions.all():
+                perms_list.append([perm.name, perm.codename, perm.content_type])
+            all_perms.append(perms_list)
+    with schema_context(schema_name):
+        Permission.objects.all().delete()
+        content_types = ContentType.objects.all()
+        for group, perms in zip(groups, all_perms):
+            for perm in perms:
+                for ct in content_types:
+                    if str(perm[2]) == str(ct):
+                        perm[2] = ct
+            mygroup, created = Group.objects.get_or_create(name=group.name)
+            mygroup.permissions.clear()
+            for perm in perms:
+                permission = Permission.objects.get_or_create(codename=perm[1], name=perm[0], content_type=perm[2])
+                mygroup.permissions.add(permission[0])
+
+
+def signup_migrate(client):
+    # How GlobalClientCreateView.post did it: all migrations, then groups and permissions copied from a1
+    client.save()
+    copy_groups_one_by_one(client.schema_name)
+
+
+def signup_clone(client):
+    provision_tenant(client, settings.TENANT_TEMPLATE_SCHEMA)
+
+
+def measure(signup, prefix, repeat):
+    times = []
+    for i in range(repeat):
+        schema = '%s%d' % (prefix, i)
+        client = Client(schema_name=schema, domain_url=schema + '.bench.local', name=schema, lang='en')
+        start = time.time()
+        signup(client)
+        times.append(time.time() - start)
+        client.delete(force_drop=True)
+    return times
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Benchmark of the tenant sign-up: migrations versus the clone of the template schema." \
+           " Temporary tenants bench_migrate_N and bench_clone_N are dropped after the measure." \
+           " Usage: python manage.py bench_tenant_signup [--repeat 3]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        template = settings.TENANT_TEMPLATE_SCHEMA
+        if not template or not schema_exists(template):
+            raise CommandError('Create the template schema first: python manage.py create_template_schema')
+
+        repeat = options['repeat']
+        before = measure(signup_migrate, 'bench_migrate_', repeat)
+        after = measure(signup_clone, 'bench_clone_', repeat)
+
+        self.stdout.write('Sign-ups: ' + str(repeat))
+        self.stdout.write('Before ( migrate_schemas + copy of groups ): min %.2f s, mean %.2f s' %
+                          (min(before), sum(before) / repeat))
+        self.stdout.write('After ( clone of the template schema ):     min %.2f s, mean %.2f s' %
+                          (min(after), sum(after) / repeat))
+        self.stdout.write('Speedup: %.1fx' % (min(before) / min(after) if min(after) else 0))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import connection
+from tenant_schemas.utils import schema_exists
+
+from globalcustomer.provision import install_clone_schema, sync_permissions
+from simpleCRM import settings
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Create the template schema of new tenants ( settings.TENANT_TEMPLATE_SCHEMA ): run all tenant" \
+           " migrations, copy groups with permissions from the source tenant and install the clone_schema()" \
+           " function of the database." \
+           " Usage: python manage.py create_template_schema [--source a1] [--rebuild]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=str, default='a1', help='Schema with groups and permissions')
+        parser.add_argument('--rebuild', action='store_true', default=False,
+                            help='Drop the existing template schema first')
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        template = settings.TENANT_TEMPLATE_SCHEMA
+        if not template:
+            raise CommandError('settings.TENANT_TEMPLATE_SCHEMA is not set')
+
+        if schema_exists(template):
+            if not options['rebuild']:
+                raise CommandError('Schema ' + template + ' already exists, use --rebuild to create it again')
+            with connection.cursor() as cursor:
+                cursor.execute('DROP SCHEMA %s CASCADE' % connection.ops.quote_name(template))
+
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA %s' % connection.ops.quote_name(template))
+        call_command('migrate_schemas', tenant=True, schema_name=template, interactive=False,
+                     verbosity=options['verbosity'])
+        sync_permissions(options['source'], template)
+        install_clone_schema()
+        self.stdout.write('Template schema ' + template + ' is ready')
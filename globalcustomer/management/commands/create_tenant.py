@@ -3,6 +3,7 @@ __author__ = 'AMA'
 
 from django.core.management import BaseCommand
 from globalcustomer.models import Client
+from globalcustomer.provision import provision_tenant
 
 
 # The class must be named Command, and subclass BaseCommand
@@ -21,4 +22,6 @@ class Command(BaseCommand):
         # create your first real tenant
         du = options['tenant'][0] + '.' + options['tenant'][1]
         tenant = Client(domain_url=du,  schema_name=options['tenant'][0], name='aaa')
-        tenant.save()  # migrate_schemas automatically called, your tenant is ready to be used!
+        # migrate_schemas automatically called or the schema is cloned from TENANT_TEMPLATE_SCHEMA,
+        # your tenant is ready to be used!
+        provision_tenant(tenant)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+from django.core.management import BaseCommand
+from tenant_schemas.utils import get_tenant_model
+
+from globalcustomer.provision import sync_permissions
+
+
+# The class must be named Command, and subclass BaseCommand
+class Command(BaseCommand):
+    # Show this when the user types help
+    help = "Replicate permissions and groups of the source tenant into other tenants ( all by default )," \
+           " e.g. after a model or permission change." \
+           " Usage: python manage.py sync_permissions [--source a1] [schema_name ...]"
+
+    def add_arguments(self, parser):
+        parser.add_argument('schemas', nargs='*', type=str)
+        parser.add_argument('--source', type=str, default='a1')
+
+    # A command must define handle()
+    def handle(self, *args, **options):
+        source = options['source']
+        schemas = options['schemas']
+        if not schemas:
+            schemas = get_tenant_model().objects.exclude(schema_name__in=['public', source]) \
+                .values_list('schema_name', flat=True)
+
+        for schema in schemas:
+            permissions, group_permissions = sync_permissions(source, schema)
+            self.stdout.write('Schema ' + str(schema) + ': ' + str(permissions) + ' permissions and ' +
+                              str(group_permissions) + ' group permissions added')
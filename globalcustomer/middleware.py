@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-#
+__author__ = 'AMA'
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from tenant_schemas.middleware import TenantMiddleware
+from tenant_schemas.utils import get_tenant_model, get_public_schema_name
+
+from simpleCRM import settings
+
+
+class TenantCache(object):
+    """
+    In-process LRU cache with TTL for tenants, keyed by domain.
+
+    >>> cache = TenantCache(maxsize=2, ttl=60)
+    >>> cache.set('a.example.com', 'a'); cache.set('b.example.com', 'b'); cache.get('a.example.com')
+    'a'
+    >>> cache.set('c.example.com', 'c')  # b is the least recently used
+    >>> cache.get('b.example.com') is None
+    True
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+tenant_cache = TenantCache(maxsize=getattr(settings, 'TENANT_CACHE_SIZE', 256),
+                           ttl=getattr(settings, 'TENANT_CACHE_TIMEOUT', 300))
+
+
+class CachedTenantMiddleware(TenantMiddleware):
+    """
+    TenantMiddleware which looks up a tenant in the public schema only once per domain and TTL.
+    The cache is cleared when any Client is saved or deleted ( see globalcustomer.signals ).
+    Also puts the tenant language into request.tenant_lang.
+    TenantMiddleware.process_request of tenant-schemas 1.6 has no hook for the lookup, so it is repeated here.
+    """
+
+    def get_tenant(self, hostname):
+        tenant = tenant_cache.get(hostname)
+        if tenant is None:
+            TenantModel = get_tenant_model()
+            try:
+                tenant = TenantModel.objects.get(domain_url=hostname)
+            except TenantModel.DoesNotExist:
+                raise self.TENANT_NOT_FOUND_EXCEPTION('No tenant for hostname "%s"' % hostname)
+            tenant_cache.set(hostname, tenant)
+        # every request gets its own copy, so nobody changes the cached one
+        return copy.copy(tenant)
+
+    def process_request(self, request):
+        # Connection needs first to be at the public schema, as this is where the tenant metadata is stored
+        connection.set_schema_to_public()
+        hostname = self.hostname_from_request(request)
+
+        request.tenant = self.get_tenant(hostname)
+        connection.set_tenant(request.tenant)
+
+        # Content types differ from schema to schema ( see TenantMiddleware )
+        ContentType.objects.clear_cache()
+
+        # Do we have a public-specific urlconf?
+        if hasattr(settings, 'PUBLIC_SCHEMA_URLCONF') and request.tenant.schema_name == get_public_schema_name():
+            request.urlconf = settings.PUBLIC_SCHEMA_URLCONF
+
+        request.tenant_lang = getattr(request.tenant, 'lang', None) or settings.MY_LANG_CODE
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-#
+
+# Fast provisioning of tenants. Instead of running all migrations of TENANT_APPS for every new organization
+# ( Client.save() -> migrate_schemas ) the schema is cloned from a pre-migrated template schema
+# by one call of the clone_schema() function of PostgreSQL: tables with indexes, data ( migrations history,
+# content types, permissions, groups ), sequences, foreign keys and triggers. See create_template_schema command,
+# it also installs the clone_schema() function into the public schema.
+# Groups and permissions of tenants are replicated from a source tenant by sync_permissions ( bulk queries ).
+
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from tenant_schemas.utils import schema_context, get_public_schema_name
+
+from simpleCRM import settings
+
+__author__ = 'AMA'
+
+CLONE_SCHEMA_FUNCTION = """
+CREATE OR REPLACE FUNCTION clone_schema(source_schema text, dest_schema text) RETURNS void AS $$
+DECLARE
+    obj record;
+    seq_name text;
+    seq_value bigint;
+    seq_called boolean;
+BEGIN
+    -- names of the source objects are shown qualified by pg_get_* functions
+    PERFORM set_config('search_path', 'public', true);
+    EXECUTE format('CREATE SCHEMA %I', dest_schema);
+
+    FOR obj IN SELECT sequence_name FROM information_schema.sequences WHERE sequence_schema = source_schema LOOP
+        EXECUTE format('CREATE SEQUENCE %I.%I', dest_schema, obj.sequence_name);
+        EXECUTE format('SELECT last_value, is_called FROM %I.%I', source_schema, obj.sequence_name)
+            INTO seq_value, seq_called;
+        PERFORM setval(format('%I.%I', dest_schema, obj.sequence_name), seq_value, seq_called);
+    END LOOP;
+
+    FOR obj IN SELECT table_name FROM information_schema.tables
+               WHERE table_schema = source_schema AND table_type = 'BASE TABLE' LOOP
+        EXECUTE format('CREATE TABLE %I.%I (LIKE %I.%I INCLUDING ALL)',
+                       dest_schema, obj.table_name, source_schema, obj.table_name);
+        EXECUTE format('INSERT INTO %I.%I SELECT * FROM %I.%I',
+                       dest_schema, obj.table_name, source_schema, obj.table_name);
+    END LOOP;
+
+    -- serial columns must use the sequences of the new schema
+    FOR obj IN SELECT table_name, column_name,
+                      pg_get_serial_sequence(format('%I.%I', table_schema, table_name), column_name) AS seq
+               FROM information_schema.columns WHERE table_schema = source_schema LOOP
+        IF obj.seq IS NOT NULL THEN
+            seq_name := split_part(obj.seq, '.', 2);
+            EXECUTE format('ALTER TABLE %I.%I ALTER COLUMN %I SET DEFAULT nextval(%L::regclass)',
+                           dest_schema, obj.table_name, obj.column_name, format('%I.%s', dest_schema, seq_name));
+            EXECUTE format('ALTER SEQUENCE %I.%s OWNED BY %I.%I.%I',
+                           dest_schema, seq_name, dest_schema, obj.table_name, obj.column_name);
+        END IF;
+    END LOOP;
+
+    -- foreign keys are added after the data, LIKE does not copy them
+    FOR obj IN SELECT rel.relname AS table_name, con.conname, pg_get_constraintdef(con.oid) AS definition
+               FROM pg_constraint con
+               JOIN pg_class rel ON rel.oid = con.conrelid
+               JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+               WHERE ns.nspname = source_schema AND con.contype = 'f' LOOP
+        EXECUTE format('ALTER TABLE %I.%I ADD CONSTRAINT %I %s', dest_schema, obj.table_name, obj.conname,
+                       replace(obj.definition, 'REFERENCES ' || quote_ident(source_schema) || '.',
+                               'REFERENCES ' || quote_ident(dest_schema) || '.'));
+    END LOOP;
+
+    -- triggers ( e.g. of search_vector columns ), after the data is copied as it is
+    FOR obj IN SELECT pg_get_triggerdef(t.oid) AS definition
+               FROM pg_trigger t
+               JOIN pg_class rel ON rel.oid = t.tgrelid
+               JOIN pg_namespace ns ON ns.oid = rel.relnamespace
+               WHERE ns.nspname = source_schema AND NOT t.tgisinternal LOOP
+        EXECUTE replace(obj.definition, ' ON ' || quote_ident(source_schema) || '.',
+                        ' ON ' || quote_ident(dest_schema) || '.');
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql VOLATILE;
+"""
+
+
+def install_clone_schema():
+    # Once per database ( and after changes of CLONE_SCHEMA_FUNCTION ), not on every sign-up
+    with schema_context(get_public_schema_name()):
+        with connection.cursor() as cursor:
+            cursor.execute(CLONE_SCHEMA_FUNCTION)
+
+
+def clone_schema(source, dest):
+    '''
+    Create the schema dest as a copy of the schema source ( structure and data ) on the database server.
+    The function must be installed by install_clone_schema().
+    '''
+    with schema_context(get_public_schema_name()):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT clone_schema(%s, %s)', [source, dest])
+
+
+def provision_tenant(client, template=None, permissions_source=None):
+    '''
+    Save the new Client and create its schema. With the template schema ( settings.TENANT_TEMPLATE_SCHEMA )
+    the schema is cloned from it with groups and permissions, else all migrations are run as usual
+    by Client.save() and groups with permissions are copied from the schema permissions_source, if it is given.
+    '''
+    template = template or getattr(settings, 'TENANT_TEMPLATE_SCHEMA', None)
+    if not template:
+        client.save()
+        if permissions_source:
+            sync_permissions(permissions_source, client.schema_name)
+        return client
+
+    with transaction.atomic():
+        clone_schema(template, client.schema_name)
+        # the schema is ready, don't let TenantMixin run migrate_schemas
+        client.auto_create_schema = False
+        client.save()
+    return client
+
+
+def sync_permissions(source, dest):
+    '''
+    Replicate permissions and groups ( with their permissions ) of the schema source into the schema dest.
+    Content types and permissions are matched by (app_label, model) and codename with dict lookups, as their ids
+    differ from schema to schema. Missing permissions and groups are created, permissions of the groups are set
+    the same as in the source, all by bulk queries. Permissions of dest are never deleted, so permissions of users
+    are kept. Return the number of created permissions and group permissions.
+    '''
+    with schema_context(source):
+        source_perms = list(Permission.objects.values_list('content_type__app_label', 'content_type__model',
+                                                           'codename', 'name'))
+        group_perms = list(Group.permissions.through.objects.values_list(
+            'group__name', 'permission__content_type__app_label', 'permission__content_type__model',
+            'permission__codename'))
+        names = list(Group.objects.values_list('name', flat=True))
+
+    with schema_context(dest), transaction.atomic():
+        content_types = {(app_label, model): pk for pk, app_label, model in
+                         ContentType.objects.values_list('id', 'app_label', 'model')}
+        existing = set(Permission.objects.values_list('content_type_id', 'codename'))
+        new_perms = [Permission(content_type_id=content_types[(app_label, model)], codename=codename, name=name)
+                     for app_label, model, codename, name in source_perms
+                     if (app_label, model) in content_types and
+                     (content_types[(app_label, model)], codename) not in existing]
+        Permission.objects.bulk_create(new_perms)
+        permissions = {(app_label, model, codename): pk for pk, app_label, model, codename in
+                       Permission.objects.values_list('id', 'content_type__app_label', 'content_type__model',
+                                                      'codename')}
+
+        existing = set(Group.objects.filter(name__in=names).values_list('name', flat=True))
+        Group.objects.bulk_create(Group(name=name) for name in names if name not in existing)
+        groups = dict(Group.objects.filter(name__in=names).values_list('name', 'id'))
+
+        through = Group.permissions.through
+        wanted = set((groups[name], permissions[(app_label, model, codename)])
+                     for name, app_label, model, codename in group_perms if (app_label, model, codename) in permissions)
+        rows = {(group_id, permission_id): pk for pk, group_id, permission_id in
+                through.objects.filter(group_id__in=groups.values()).values_list('id', 'group_id', 'permission_id')}
+        current = set(rows)
+        through.objects.filter(id__in=[rows[key] for key in current - wanted]).delete()
+        through.objects.bulk_create(through(group_id=group_id, permission_id=permission_id)
+                                    for group_id, permission_id in wanted - current)
+    return len(new_perms), len(wanted - current)
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-#
 
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver, Signal
 
+from globalcustomer.middleware import tenant_cache
+from globalcustomer.models import Client
+
 from simpleCRM import settings
 
 __author__ = 'AMA'
@@ -13,3 +17,10 @@ ChooseLang = Signal(providing_args=["lang"])
 def my_callback(sender, **kwargs):
     # receive language choice signal and set static variable
     settings.MY_LANG_CODE = kwargs['lang']
+
+
+# Domain or language of a tenant may be changed, so forget all resolved tenants
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def clear_tenant_cache(sender, **kwargs):
+    tenant_cache.clear()
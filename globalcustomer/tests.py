@@ -1,11 +1,19 @@
 from django.contrib.sites.shortcuts import get_current_site
 from django.http import HttpRequest
 from django.test import LiveServerTestCase
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
+from django.db import connection
 from django.test import Client as TestClient
 from globalcustomer.forms import GlobalClientForm
 from globalcustomer.models import Client
+from globalcustomer.middleware import CachedTenantMiddleware, tenant_cache
 from django.core.urlresolvers import reverse
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from tenant_schemas.utils import schema_context
+from globalcustomer.provision import sync_permissions, install_clone_schema, provision_tenant
+from io import StringIO
 
 from selenium import webdriver
 from simpleCRM.settings import BASE_DIR, DEBUG
@@ -29,6 +37,105 @@ class NewTenantView(TestCase):
         response = client.post(url)
         self.assertEqual(response.status_code, 200)
 
+
+class CachedTenantMiddlewareTest(TestCase):
+
+    def setUp(self):
+        Client.objects.create(schema_name='public', domain_url='cached.example.com', name='corp_name', lang='en')
+        tenant_cache.clear()
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+
+    def test_tenant_is_cached(self):
+        middleware = CachedTenantMiddleware()
+        with self.assertNumQueries(1):
+            middleware.process_request(RequestFactory().get('/', HTTP_HOST='cached.example.com'))
+        request = RequestFactory().get('/', HTTP_HOST='cached.example.com')
+        with self.assertNumQueries(0):
+            middleware.process_request(request)
+        self.assertEqual(request.tenant.name, 'corp_name')
+        self.assertEqual(request.tenant_lang, 'en')
+        self.assertEqual(request.urlconf, 'simpleCRM.urls_public')
+
+
+class ProvisionTest(TestCase):
+    # Real schemas of tenants ( all migrations ), they are dropped with the rollback of the test transaction
+
+    @classmethod
+    def setUpTestData(cls):
+        for schema in ('prov_source', 'prov_dest'):
+            Client(schema_name=schema, domain_url=schema + '.example.com', name=schema, lang='en').save(verbosity=0)
+        with schema_context('prov_source'):
+            deal = ContentType.objects.get(app_label='crm', model='deal')
+            export = Permission.objects.create(content_type=deal, codename='export_deal', name='Can export deal')
+            boss = Group.objects.create(name='boss')
+            boss.permissions.add(export, Permission.objects.get(content_type=deal, codename='change_deal'))
+            Group.objects.create(name='manager')
+
+    def tearDown(self):
+        connection.set_schema_to_public()
+
+    def group_permissions(self, schema, name):
+        with schema_context(schema):
+            return set(Group.objects.get(name=name).permissions.values_list('codename', flat=True))
+
+    def test_sync_permissions_adds(self):
+        self.assertEqual(sync_permissions('prov_source', 'prov_dest'), (1, 2))
+        self.assertEqual(self.group_permissions('prov_dest', 'boss'), {'export_deal', 'change_deal'})
+        self.assertEqual(self.group_permissions('prov_dest', 'manager'), set())
+        # nothing to do the second time
+        self.assertEqual(sync_permissions('prov_source', 'prov_dest'), (0, 0))
+
+    def test_sync_permissions_removes_group_permissions(self):
+        with schema_context('prov_dest'):
+            boss = Group.objects.create(name='boss')
+            boss.permissions.add(Permission.objects.get(content_type__app_label='crm', codename='delete_deal'))
+            own = Permission.objects.create(content_type=ContentType.objects.get(app_label='crm', model='deal'),
+                                            codename='archive_deal', name='Can archive deal')
+
+        sync_permissions('prov_source', 'prov_dest')
+        self.assertEqual(self.group_permissions('prov_dest', 'boss'), {'export_deal', 'change_deal'})
+        with schema_context('prov_dest'):
+            # permissions themselves are kept, users may have them
+            self.assertTrue(Permission.objects.filter(pk=own.pk).exists())
+            self.assertTrue(Permission.objects.filter(codename='delete_deal').exists())
+
+    def test_sync_permissions_command(self):
+        out = StringIO()
+        call_command('sync_permissions', 'prov_dest', source='prov_source', stdout=out)
+        self.assertIn('Schema prov_dest: 1 permissions and 2 group permissions added', out.getvalue())
+        self.assertEqual(self.group_permissions('prov_dest', 'boss'), {'export_deal', 'change_deal'})
+
+    def test_provision_tenant_from_template(self):
+        install_clone_schema()
+        client = provision_tenant(Client(schema_name='prov_clone', domain_url='prov_clone.example.com',
+                                         name='prov_clone', lang='en'), template='prov_source')
+        self.assertTrue(Client.objects.filter(pk=client.pk, schema_name='prov_clone').exists())
+
+        with connection.cursor() as cursor:
+            tables = "SELECT table_name FROM information_schema.tables WHERE table_schema = %s ORDER BY 1"
+            cursor.execute(tables, ['prov_source'])
+            source_tables = cursor.fetchall()
+            cursor.execute(tables, ['prov_clone'])
+            self.assertEqual(cursor.fetchall(), source_tables)
+            self.assertIn(('crm_deal',), source_tables)
+            # serial columns use the sequences of the clone
+            cursor.execute("SELECT pg_get_serial_sequence('prov_clone.auth_group', 'id')")
+            self.assertEqual(cursor.fetchone()[0], 'prov_clone.auth_group_id_seq')
+
+        # the sequences start where the template stopped and go on independently
+        with schema_context('prov_clone'):
+            clone_group = Group.objects.create(name='clone')
+        with schema_context('prov_source'):
+            self.assertLess(Group.objects.order_by('-pk')[0].pk, clone_group.pk)
+            self.assertEqual(Group.objects.create(name='source').pk, clone_group.pk)
+
+        self.assertEqual(self.group_permissions('prov_clone', 'boss'), {'export_deal', 'change_deal'})
+        with schema_context('prov_clone'):
+            self.assertTrue(Permission.objects.filter(codename='export_deal').exists())
+
+
 # Integration test with LiveServer and Selenium webdriver.
 # For use: python manage.py test --liveserver=example.com:8000
 class NewTenantView_selenium(LiveServerTestCase):
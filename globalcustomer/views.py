@@ -6,12 +6,12 @@ from django.shortcuts import render
 from django.utils import translation
 from django.utils.translation import ugettext_lazy as _
 from django.views.generic import CreateView
-from django.contrib.auth.models import Group, User, Permission
-from django.contrib.contenttypes.models import ContentType
+from django.contrib.auth.models import Group, User
 from tenant_schemas.utils import schema_context
 
 from globalcustomer.forms import GlobalClientForm, ChooseLangForm
 from globalcustomer.models import Client
+from globalcustomer.provision import provision_tenant
 from globalcustomer.signals import ChooseLang
 
 from simpleCRM.settings import DEBUG
@@ -54,10 +54,10 @@ class GlobalClientCreateView(CreateView):
             rec = form.save(commit=False)
             rec.domain_url = form.data['schema_name'] + '.' + current_site.domain
             rec.lang = settings.MY_LANG_CODE
-            rec.save()
             site = 'http://' + form.data['schema_name'] + '.' + current_site.name
 
-            self.create_group_and_permissions(form.data['schema_name'])
+            # Use a1 schema, as a source permissions and groups data ( if the schema is not cloned with them )
+            provision_tenant(rec, permissions_source='a1')
             self.create_users(form.data['schema_name'])
 
             if DEBUG:
@@ -67,41 +67,6 @@ class GlobalClientCreateView(CreateView):
             messages.error(request, _('Что-то пошло не так'))
             return super().post(self, request, *args, **kwargs)
 
-    def create_group_and_permissions(self, schema_name):
-
-        all_perms=[]
-        # Use a1 schema, as a source permissions and groups data
-        with schema_context('a1'):
-            # Go through all groups and grab permissions for each one
-            groups = Group.objects.all()
-            for group in groups:
-                perms = group.permissions.all()
-                perms_list = []
-                for perm in perms:
-                    perms_list.append([perm.name,perm.codename,perm.content_type])
-                all_perms.append(perms_list)
-        # So, we have groups - the list of group and all_perms - the list of permissions of each permission group
-        with schema_context(schema_name):
-            # Delete all permissions to avoid future conflicts
-            Permission.objects.all().delete()
-            # Grab all content types from new tenant
-            content_types = ContentType.objects.all()
-
-            for group, perms in zip(groups, all_perms):
-                # Some tricky moment. Change content type from source tenant on content type new tenant
-                for perm in perms:
-                    for ct in content_types:
-                        if str(perm[2]) == str(ct):
-                            perm[2] = ct
-
-                mygroup, created = Group.objects.get_or_create(name=group.name)
-                # Delete all group permissions to avoid future conflicts
-                mygroup.permissions.clear()
-                # Create permissions and add it to group
-                for perm in perms:
-                    permission = Permission.objects.get_or_create(codename=perm[1], name=perm[0], content_type=perm[2])
-                    mygroup.permissions.add(permission[0])
-
     def create_users(self, schema_name):
 
         with schema_context(schema_name):
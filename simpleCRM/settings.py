@@ -67,7 +67,8 @@ INSTALLED_APPS = list(set(TENANT_APPS + SHARED_APPS))
 # Be CAREFUL ! Order of middleware is very IMPORTANT !
 MIDDLEWARE_CLASSES = [
     # Make sure it’s one of the first middlewares installed.
-    'tenant_schemas.middleware.TenantMiddleware',
+    # It's tenant_schemas.middleware.TenantMiddleware with the cache of resolved tenants
+    'globalcustomer.middleware.CachedTenantMiddleware',
 
     'django.contrib.sessions.middleware.SessionMiddleware',
     # LocaleMiddleware should come after SessionMiddleware, because LocaleMiddleware makes use of session data.
@@ -83,6 +84,8 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # request.crm_user - SalesPerson, role, language and groups of the user, resolved once per session
+    'crm.user_context.UserContextMiddleware',
 ]
 
 ROOT_URLCONF = 'simpleCRM.urls_tenants'
@@ -144,6 +147,59 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Local-memory cache is enough for common data. Reports use file based cache, so the cached results and
+# their invalidation are shared between all processes of the site without any external service.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'reports'),
+    },
+}
+
+REPORT_CACHE = 'reports'
+REPORT_CACHE_TIMEOUT = 60 * 15  # seconds
+# Read reports from crm.DailySales rollup instead of raw deals.
+# Run "python manage.py rebuild_daily_sales" once before switching it on.
+REPORTS_FROM_ROLLUP = False
+
+# In-process cache of tenants resolved by domain name
+TENANT_CACHE_SIZE = 256
+TENANT_CACHE_TIMEOUT = 60 * 5  # seconds
+
+# New tenants are cloned from this pre-migrated schema instead of running all migrations.
+# Create it by "python manage.py create_template_schema" ( and after every new migration ), None - migrate as before
+TENANT_TEMPLATE_SCHEMA = None
+
+# Max age of the user context ( SalesPerson, role, language, groups ) kept in the session, seconds
+USER_CONTEXT_TIMEOUT = 60 * 5
+# Cache of the user context versions, it must be shared by all processes of the site ( not local-memory ),
+# else other processes keep the old role of the user until USER_CONTEXT_TIMEOUT
+USER_CONTEXT_CACHE = 'reports'
+
+# Pagination of the list tables: 'offset' ( page numbers ) or 'keyset' ( next / previous links, no COUNT(*) ).
+# The mode can be chosen per request by ?paging=keyset
+TABLE_PAGINATION = 'offset'
+
+# Rows read by one query of the CSV export ( ?export=csv of the list tables )
+EXPORT_CHUNK_SIZE = 2000
+
+# Row scoping: users who are not bosses see and edit only deals, customers and todos of their own
+# ( sales_person__user = user ), without guardian rows per object. Object permissions are left for exceptions
+ROW_SCOPING = False
+
+# Product picker of the deal pages ( /crm/products/search/ ): max results and seconds to cache them
+PRODUCT_SEARCH_LIMIT = 20
+PRODUCT_SEARCH_CACHE_TIMEOUT = 60
+
+# Max results of every model ( customers, deals, todos ) of the full-text search ( /crm/search/?q= )
+SEARCH_LIMIT = 10
+
+# Rows inserted by one bulk_create of the customer import
+IMPORT_BATCH_SIZE = 1000
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.10/topics/i18n/
 